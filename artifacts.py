@@ -0,0 +1,166 @@
+# backend/app/artifacts.py
+# Content-addressed artifact storage. Blobs live once under ARTIFACT_PATH/blobs/<sha256[:2]>/<sha256>;
+# each build has a manifest mapping artifact paths to blob hashes, so identical jars across builds share a blob.
+# Uploads are hashed while being streamed to a temp file and renamed into place, never held in memory.
+import glob
+import hashlib
+import json
+import os
+import posixpath
+import tempfile
+import threading
+import time
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+import aiofiles
+import aiofiles.os
+from .config import settings
+from .offload import run_blocking
+
+CHUNK_SIZE = 1024 * 1024
+
+_manifest_locks: Dict[str, threading.Lock] = {}
+_manifest_locks_guard = threading.Lock()
+
+class ArtifactPathError(Exception):
+    pass
+
+def clean_path(path: str) -> str:
+    """Relative, normalized artifact path; rejects absolute paths and '..' escapes."""
+    norm = posixpath.normpath(path.replace("\\", "/")).lstrip("/")
+    if norm in ("", ".") or norm.startswith("../") or norm == "..":
+        raise ArtifactPathError(f"Invalid artifact path: {path!r}")
+    return norm
+
+def blob_path(sha256: str) -> str:
+    return os.path.join(settings.ARTIFACT_PATH, "blobs", sha256[:2], sha256)
+
+def _manifest_path(build_id: str) -> str:
+    return os.path.join(settings.ARTIFACT_PATH, "manifests", os.path.basename(build_id) + ".json")
+
+def _tmp_file() -> Tuple[int, str]:
+    tmp_dir = os.path.join(settings.ARTIFACT_PATH, "tmp")
+    os.makedirs(tmp_dir, exist_ok=True)
+    return tempfile.mkstemp(dir=tmp_dir)
+
+def _commit_blob(tmp: str, sha256: str) -> bool:
+    """Move a fully written temp file into the blob store; returns False when the blob already existed."""
+    dest = blob_path(sha256)
+    if os.path.exists(dest):
+        os.unlink(tmp)
+        return False
+    os.makedirs(os.path.dirname(dest), exist_ok=True)
+    os.replace(tmp, dest)
+    return True
+
+def _entry(path: str, sha256: str, size: int) -> Dict:
+    return {"path": path, "sha256": sha256, "size": size, "stored_at": time.time()}
+
+def _record(build_id: str, entries: List[Dict]) -> List[Dict]:
+    """Add entries to the build's manifest: one read and one atomic rewrite however many files were stored."""
+    with _manifest_locks_guard:
+        lock = _manifest_locks.setdefault(build_id, threading.Lock())
+    with lock:
+        manifest = load_manifest(build_id)
+        manifest.update((e["path"], e) for e in entries)
+        mpath = _manifest_path(build_id)
+        os.makedirs(os.path.dirname(mpath), exist_ok=True)
+        with open(mpath + ".tmp", "w") as f:
+            json.dump(manifest, f)
+        os.replace(mpath + ".tmp", mpath)
+    return entries
+
+def load_manifest(build_id: str) -> Dict[str, Dict]:
+    try:
+        with open(_manifest_path(build_id)) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return {}
+
+def get_artifact(build_id: str, path: str) -> Optional[Dict]:
+    entry = load_manifest(build_id).get(clean_path(path))
+    if entry:
+        entry = {**entry, "blob": blob_path(entry["sha256"])}
+    return entry
+
+def list_artifacts(build_id: str) -> List[Dict]:
+    return sorted(load_manifest(build_id).values(), key=lambda e: e["path"])
+
+def _store_blob(path: str, src: str) -> Dict:
+    """Hash a workspace file and add it to the blob store (skipping the copy if present); returns its entry."""
+    h = hashlib.sha256()
+    size = 0
+    with open(src, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            h.update(chunk)
+            size += len(chunk)
+    sha256 = h.hexdigest()
+    if not os.path.exists(blob_path(sha256)):
+        fd, tmp = _tmp_file()
+        with os.fdopen(fd, "wb") as out, open(src, "rb") as f:
+            for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+                out.write(chunk)
+        _commit_blob(tmp, sha256)
+    return _entry(path, sha256, size)
+
+def store_file(build_id: str, path: str, src: str) -> Dict:
+    """Archive a workspace file; the hash is computed first so an already-stored blob is never copied."""
+    return _record(build_id, [_store_blob(clean_path(path), src)])[0]
+
+async def store_stream(build_id: str, path: str, chunks: AsyncIterator[bytes]) -> Dict:
+    """Archive an upload as it arrives (e.g. Request.stream()), hashing each chunk on the way to disk."""
+    path = clean_path(path)
+    fd, tmp = await run_blocking(_tmp_file)
+    os.close(fd)
+    h = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp, "wb") as out:
+            async for chunk in chunks:
+                h.update(chunk)
+                size += len(chunk)
+                await out.write(chunk)
+    except BaseException:
+        await aiofiles.os.remove(tmp)
+        raise
+    entry = _entry(path, h.hexdigest(), size)
+    await run_blocking(_commit_blob, tmp, entry["sha256"])
+    await run_blocking(_record, build_id, [entry])
+    return entry
+
+async def read_blob(blob: str, start: int = 0, end: Optional[int] = None) -> AsyncIterator[bytes]:
+    """Bytes [start, end) of a blob in CHUNK_SIZE pieces."""
+    async with aiofiles.open(blob, "rb") as f:
+        await f.seek(start)
+        remaining = (end - start) if end is not None else None
+        while remaining is None or remaining > 0:
+            chunk = await f.read(CHUNK_SIZE if remaining is None else min(CHUNK_SIZE, remaining))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+
+def collect_artifacts(build_id: str, workdir: str, patterns: List[str], prefix: str = "") -> List[str]:
+    """
+    Store every workspace file matching the stage's `artifacts:` globs (under prefix/, e.g. a matrix cell);
+    returns the stored paths. Matches outside the workspace (including through symlinks) are skipped, never
+    fatal to the build.
+    """
+    entries = []
+    root = os.path.realpath(workdir)
+    for pattern in patterns:
+        for src in sorted(glob.glob(os.path.join(workdir, pattern), recursive=True)):
+            if not os.path.isfile(src):
+                continue
+            if os.path.commonpath([root, os.path.realpath(src)]) != root:
+                print(f"Artifact {src!r} is outside the workspace; skipped")
+                continue
+            try:
+                rel = clean_path(posixpath.join(prefix, os.path.relpath(src, workdir)))
+            except ArtifactPathError as e:
+                print(f"{e}; skipped")
+                continue
+            entries.append(_store_blob(rel, src))
+    if entries:
+        _record(build_id, entries)
+    return [e["path"] for e in entries]
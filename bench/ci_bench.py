@@ -0,0 +1,390 @@
+# bench/ci_bench.py
+# Offline benchmarks for the CI server hot paths. Uses stub pipelines (true/sleep/log-spewing commands) and
+# local bare git repos only, and writes one JSON document so runs from different versions can be diffed.
+#
+#   python bench/ci_bench.py --out bench_results.json
+#   python bench/ci_bench.py --only yaml_parse,junit_parse --compare bench_results.json
+#
+# The server is imported as the `backend.app` package (the path in each module's header comment). Point
+# CI_BENCH_ROOT at the directory containing backend/ when that is not the parent of bench/. The exit status
+# is 1 when any benchmark errors and 2 when the package cannot be imported at all.
+import argparse
+import asyncio
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import quote
+
+WORKDIR = tempfile.mkdtemp(prefix="ci_bench_")
+# settings are read from the environment at import, so point every storage path at the scratch dir first
+for _name, _sub in (("REPO_BASE_PATH", "repos"), ("LOG_PATH", "logs"), ("LOG_SEARCH_DB", "logs/search.db"),
+                    ("ARTIFACT_PATH", "artifacts"), ("STATE_DB", "state/state.db"), ("MAVEN_DAEMON_PATH", "mvnd"),
+                    ("TEMPLATE_PATH", "templates"), ("TEMPLATE_CACHE_PATH", "template_cache"),
+                    ("SECRETS_PATH", "secrets/secrets.json")):
+    os.environ.setdefault(_name, os.path.join(WORKDIR, _sub))
+os.environ.setdefault("STATE_BACKEND", "memory")  # a shared SQLite store is opt-in, never picked up by accident
+os.environ.setdefault("WORKSPACE_PREWARM", "false")  # background clones would skew the workspace timings
+os.environ.setdefault("SMTP_PORT", "1")  # fail notifications fast instead of waiting on a mail server
+sys.path.insert(0, os.environ.get("CI_BENCH_ROOT") or os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+BENCHMARKS = {}
+
+def benchmark(fn):
+    BENCHMARKS[fn.__name__] = fn
+    return fn
+
+def _rate(count: int, seconds: float) -> float:
+    return round(count / seconds, 2) if seconds else float("inf")
+
+def _percentiles(samples):
+    samples = sorted(samples)
+    pick = lambda q: samples[min(len(samples) - 1, int(q * len(samples)))]
+    return {"p50_ms": round(pick(0.50) * 1000, 3), "p90_ms": round(pick(0.90) * 1000, 3),
+            "p99_ms": round(pick(0.99) * 1000, 3), "mean_ms": round(statistics.mean(samples) * 1000, 3)}
+
+def _git(*args, cwd=None):
+    subprocess.run(["git", *args], cwd=cwd, check=True, capture_output=True)
+
+def make_bare_repo(name: str, files: int = 200) -> str:
+    """A local bare repo with one commit of `files` small files; returns its file:// URL."""
+    src = os.path.join(WORKDIR, "src", name)
+    bare = os.path.join(WORKDIR, "remotes", name + ".git")
+    os.makedirs(src)
+    for i in range(files):
+        with open(os.path.join(src, f"f{i}.txt"), "w") as f:
+            f.write(f"file {i}\n" * 50)
+    _git("init", "-q", src)
+    _git("add", "-A", cwd=src)
+    _git("-c", "user.name=bench", "-c", "user.email=bench@example.com", "commit", "-qm", "init", cwd=src)
+    _git("clone", "-q", "--bare", src, bare)
+    return "file://" + bare
+
+_LAZY_MODULES = ("git", "apscheduler", "requests", "smtplib", "yaml")  # must not load just by importing the app
+
+@benchmark
+def import_time(scale):
+    """Cold import of the API app in fresh interpreters, plus the -X importtime breakdown of one of them."""
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = {**os.environ, "PYTHONPATH": root}
+    probe = ("import sys, time; t = time.perf_counter(); import backend.app.main; "
+             "print(time.perf_counter() - t); print(','.join(sorted(m for m in sys.modules if '.' not in m)))")
+    samples, loaded = [], set()
+    for _ in range(5 * scale):
+        out = subprocess.run([sys.executable, "-c", probe], env=env, capture_output=True, text=True, check=True)
+        seconds, modules = out.stdout.splitlines()[-2:]
+        samples.append(float(seconds))
+        loaded = set(modules.split(","))
+    trace = subprocess.run([sys.executable, "-X", "importtime", "-c", "import backend.app.main"], env=env,
+                           capture_output=True, text=True, check=True).stderr
+    # "import time: self [us] | cumulative | imported package"; top-level packages only
+    heaviest = []
+    for line in trace.splitlines():
+        parts = line.split("|")
+        if len(parts) == 3 and parts[1].strip().isdigit() and not parts[2].startswith("  "):
+            heaviest.append((int(parts[1]), parts[2].strip()))
+    heaviest.sort(reverse=True)
+    return {"import": _percentiles(samples), "heaviest_ms": {name: round(us / 1000, 2) for us, name in heaviest[:10]},
+            "eager_heavy_modules": sorted(loaded & set(_LAZY_MODULES))}
+
+@benchmark
+def queue_throughput(scale):
+    from backend.app import queue
+    from backend.app.state_store import get_store
+    n = 20000 * scale
+    start = time.perf_counter()
+    for i in range(n):
+        queue.enqueue_job("bench-job", {"I": str(i)})
+    enq = time.perf_counter() - start
+    start = time.perf_counter()
+    drained = 0
+    store = get_store()
+    while True:
+        item = store.queue_lease("bench", 60)  # the same atomic lease + ack a worker does
+        if item is None:
+            break
+        store.queue_ack(item["build_id"], "bench")
+        drained += 1
+    deq = time.perf_counter() - start
+    return {"items": n, "enqueue_ops_per_s": _rate(n, enq), "dequeue_ops_per_s": _rate(drained, deq)}
+
+@benchmark
+def enqueue_to_start_latency(scale):
+    from backend.app import queue
+    from backend.app.builds import get_build
+    from backend.app.job_manager import create_job, delete_job
+    from backend.app.models import JobConfig, PipelineSpec, Stage
+    url = make_bare_repo("latency")
+    job = create_job(JobConfig(name="bench-latency", repo_url=url,
+                               pipeline=PipelineSpec(name="stub", stages=[Stage(name="noop", run="true"),
+                                                                          Stage(name="nap", run="sleep 0.05")])))
+    queue.start_worker()
+    samples, total = [], 0
+    for _ in range(20 * scale):
+        build_id = queue.enqueue_job(job.id, {})
+        while True:
+            b = get_build(build_id)
+            if b["finished_at"]:
+                break
+            time.sleep(0.005)
+        samples.append(b["started_at"] - b["created_at"])
+        total += b["finished_at"] - b["created_at"]
+    delete_job(job.id)
+    return {"builds": len(samples), "enqueue_to_start": _percentiles(samples),
+            "mean_build_s": round(total / len(samples), 4)}
+
+@benchmark
+def stage_spawn_overhead(scale):
+    """Per-stage cost of a no-op by launch path: through /bin/sh, a plain shell-form command exec'd directly, exec form."""
+    from backend.app.pipeline.engine import run_stage
+    from backend.app.models import Stage
+    variants = {"shell": Stage(name="noop", run="true;"),  # the ';' forces the shell
+                "shell_plain": Stage(name="noop", run="true"),
+                "exec": Stage(name="noop", run=["true"])}
+    n = 200 * scale
+
+    async def go(stage):
+        samples = []
+        for _ in range(n):
+            t = time.perf_counter()
+            await run_stage(stage, WORKDIR)
+            samples.append(time.perf_counter() - t)
+        return samples
+    return {"stages": n, **{name: _percentiles(asyncio.run(go(stage))) for name, stage in variants.items()}}
+
+@benchmark
+def log_throughput(scale):
+    from backend.app.pipeline.engine import run_stage
+    from backend.app.models import Stage
+    lines = 200000 * scale
+    stage = Stage(name="spew", run=f"yes '[INFO] Downloading org/example/artifact/1.0/artifact-1.0.jar' | head -n {lines}")
+    t = time.perf_counter()
+    r = asyncio.run(run_stage(stage, WORKDIR))
+    elapsed = time.perf_counter() - t
+    size = r["output_bytes"]
+    return {"bytes": size, "mb_per_s": round(size / 1e6 / elapsed, 2), "seconds": round(elapsed, 4)}
+
+@benchmark
+def log_masking(scale):
+    """Streaming secret masking over 100 MB of build log in the engine's 64 KiB reads, by number of secrets."""
+    from backend.app.secret_store import MaskSet
+    line = b"[INFO] Downloading org/example/artifact/1.0/artifact-1.0.jar from https://repo.example.com\n"
+    size = 100 * 1024 * 1024 * scale
+    results = {}
+    for count in (1, 5, 20):
+        secrets = [f"s3cr3t-token-{i:04d}-abcdefghijklmnop" for i in range(count)]
+        # one leaked value roughly every 64 KiB
+        block = line * 700 + b"[DEBUG] using credentials " + secrets[-1].encode() + b"\n"
+        chunks = [block[i:i + 65536] for i in range(0, len(block), 65536)]
+        masker = MaskSet(secrets).stream()
+        out = 0
+        t = time.perf_counter()
+        for _ in range(size // len(block)):
+            for c in chunks:
+                out += len(masker.feed(c))
+        out += len(masker.flush())
+        elapsed = time.perf_counter() - t
+        total = (size // len(block)) * len(block)
+        results[f"{count}_secrets"] = {"mb_per_s": round(total / 1e6 / elapsed, 1), "bytes_removed": total - out}
+    return {"mb": round(size / 1e6, 1), **results}
+
+@benchmark
+def yaml_parse(scale):
+    from backend.app.pipeline.dsl_parser import parse_pipeline_yaml
+    stages = "".join(f"  - name: stage{i}\n    run: mvn -B -pl module{i} verify\n    env: {{A: '1', B: '2'}}\n"
+                     for i in range(50))
+    text = "name: bench\nagent: local\nstages:\n" + stages
+    n = 200 * scale
+    t = time.perf_counter()
+    for _ in range(n):
+        parse_pipeline_yaml(text)
+    return {"stages_per_doc": 50, "ops_per_s": _rate(n, time.perf_counter() - t)}
+
+@benchmark
+def junit_parse(scale):
+    from backend.app.test_processor import parse_junit_reports
+    report_dir = os.path.join(WORKDIR, "surefire-reports")
+    os.makedirs(report_dir, exist_ok=True)
+    for s in range(20 * scale):
+        cases = "".join(f'<testcase name="test{i}" classname="com.example.Suite{s}" time="0.01">'
+                        + ('<failure message="boom">trace</failure>' if i % 50 == 0 else "") + "</testcase>"
+                        for i in range(1000))
+        with open(os.path.join(report_dir, f"TEST-Suite{s}.xml"), "w") as f:
+            f.write(f'<?xml version="1.0"?><testsuite name="Suite{s}" tests="1000" failures="20" errors="0" '
+                    f'skipped="0">{cases}</testsuite>')
+    size = sum(os.path.getsize(os.path.join(report_dir, f)) for f in os.listdir(report_dir))
+    t = time.perf_counter()
+    res = parse_junit_reports(report_dir)
+    elapsed = time.perf_counter() - t
+    return {"bytes": size, "cases": len(res["cases"]), "mb_per_s": round(size / 1e6 / elapsed, 2)}
+
+@benchmark
+def pom_parse(scale):
+    from backend.app.maven_runner import parse_dependencies_from_pom
+    deps = "".join(f"<dependency><groupId>org.example.g{i}</groupId><artifactId>a{i}</artifactId>"
+                   f"<version>1.{i}</version></dependency>" for i in range(5000 * scale))
+    pom = os.path.join(WORKDIR, "pom.xml")
+    with open(pom, "w") as f:
+        f.write('<project xmlns="http://maven.apache.org/POM/4.0.0"><modelVersion>4.0.0</modelVersion>'
+                f"<dependencies>{deps}</dependencies></project>")
+    t = time.perf_counter()
+    found = parse_dependencies_from_pom(pom)
+    elapsed = time.perf_counter() - t
+    return {"dependencies": len(found), "seconds": round(elapsed, 4), "deps_per_s": _rate(len(found), elapsed)}
+
+@benchmark
+def git_clone_fetch(scale):
+    from backend.app.pipeline.multibranch import clone_or_update_repo
+    url = make_bare_repo("clone", files=500 * scale)
+    target = os.path.join(WORKDIR, "clone-target")
+    t = time.perf_counter()
+    clone_or_update_repo(url, target)
+    clone = time.perf_counter() - t
+    t = time.perf_counter()
+    clone_or_update_repo(url, target)
+    return {"files": 500 * scale, "clone_s": round(clone, 4), "fetch_s": round(time.perf_counter() - t, 4)}
+
+_server = None
+
+def _api_server() -> str:
+    """Start the app once on a background uvicorn thread and return its base URL."""
+    global _server
+    import uvicorn
+    from backend.app.main import app
+    if _server is None:
+        _server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=18765, log_level="warning"))
+        threading.Thread(target=_server.run, daemon=True).start()
+        while not _server.started:
+            time.sleep(0.05)
+    return "http://127.0.0.1:18765"
+
+def _load(url_fn, count: int, concurrency: int = 16, headers: dict = None):
+    import requests
+    session = requests.Session()
+
+    def hit(i):
+        method, url, body = url_fn(i)
+        t = time.perf_counter()
+        session.request(method, url, json=body, headers=headers).raise_for_status()
+        return time.perf_counter() - t
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        t = time.perf_counter()
+        samples = list(pool.map(hit, range(count)))
+        return samples, time.perf_counter() - t
+
+@benchmark
+def api_latency(scale):
+    from backend.app.job_manager import create_job
+    from backend.app.models import JobConfig, PipelineSpec, Stage
+    for i in range(500):
+        create_job(JobConfig(name=f"api-{i}", labels=["bench"],
+                             pipeline=PipelineSpec(name="p", stages=[Stage(name="s", run="true")])))
+    base = _api_server()
+    results = {}
+    for path in ("/queue", "/jobs?limit=50", "/jobs", "/metrics"):
+        samples, elapsed = _load(lambda i: ("GET", base + path, None), 400 * scale)
+        results[path] = {**_percentiles(samples), "req_per_s": _rate(len(samples), elapsed)}
+    # dashboards re-polling unchanged listings: a conditional request (304) and a gzip'd cached body
+    import requests
+    for path in ("/queue", "/jobs"):
+        etag = requests.get(base + path).headers["ETag"]
+        for variant, headers in (("if_none_match", {"If-None-Match": etag}), ("gzip", {"Accept-Encoding": "gzip"})):
+            samples, elapsed = _load(lambda i: ("GET", base + path, None), 400 * scale, headers=headers)
+            results[f"{path} ({variant})"] = {**_percentiles(samples), "req_per_s": _rate(len(samples), elapsed)}
+    return {"concurrency": 16, "endpoints": results}
+
+@benchmark
+def api_loop_blocking(scale):
+    """
+    Guard against blocking the API event loop: while heavy requests (large YAML parses, cron job
+    creation, full /jobs listings) are in flight, a cheap endpoint must stay fast and the loop-lag
+    watchdog must stay under LOOP_LAG_WARN_SECONDS.
+    """
+    from backend.app import offload
+    from backend.app.config import settings
+    base = _api_server()
+    # /pipelines/parse takes the YAML as a query parameter, so keep it under the server's request-line limit
+    yaml_text = "name: big\nstages:\n" + "".join(f"  - name: s{i}\n    run: echo {i}\n" for i in range(200))
+    heavy = [lambda i: ("POST", f"{base}/pipelines/parse?yaml_text=" + quote(yaml_text, safe=""), None),
+             lambda i: ("POST", base + "/jobs", {"name": f"cron-{i}", "schedule_cron": "H H * * *",
+                                                 "pipeline": {"name": "p", "stages": [{"name": "s", "run": "true"}]}}),
+             lambda i: ("GET", base + "/jobs", None)]
+    offload.max_lag = 0.0
+    with ThreadPoolExecutor(max_workers=1) as bg:
+        pending = bg.submit(_load, lambda i: heavy[i % len(heavy)](i), 60 * scale, 8)
+        probe, _ = _load(lambda i: ("GET", base + "/queue", None), 300 * scale, 2)
+        pending.result()
+    return {"probe_while_loaded": _percentiles(probe), "max_loop_lag_ms": round(offload.max_lag * 1000, 2),
+            "threshold_ms": settings.LOOP_LAG_WARN_SECONDS * 1000,
+            "ok": offload.max_lag <= settings.LOOP_LAG_WARN_SECONDS}
+
+def _git_version() -> str:
+    try:
+        return subprocess.run(["git", "describe", "--always", "--dirty"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except OSError:
+        return "unknown"
+
+def _compare(old: dict, new: dict):
+    """Print every numeric field whose value moved by more than 10% against a previous run."""
+    def walk(prefix, a, b):
+        if isinstance(a, dict) and isinstance(b, dict):
+            for k in a.keys() & b.keys():
+                walk(f"{prefix}.{k}" if prefix else k, a[k], b[k])
+        elif isinstance(a, (int, float)) and isinstance(b, (int, float)) and a:
+            change = (b - a) / a
+            if abs(change) > 0.10:
+                print(f"  {prefix}: {a} -> {b} ({change:+.0%})")
+    print(f"Changes vs {old.get('version')}:")
+    walk("", old.get("results", {}), new["results"])
+
+def main():
+    ap = argparse.ArgumentParser(description="Offline CI server benchmarks")
+    ap.add_argument("--out", default="bench_results.json")
+    ap.add_argument("--only", help="comma-separated benchmark names: " + ",".join(BENCHMARKS))
+    ap.add_argument("--scale", type=int, default=1, help="multiply workload sizes")
+    ap.add_argument("--compare", help="previous results JSON to diff against")
+    args = ap.parse_args()
+    names = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = [n for n in names if n not in BENCHMARKS]
+    if unknown:
+        ap.error("unknown benchmarks: " + ",".join(unknown))
+    try:
+        import backend.app  # noqa: F401
+    except ImportError as e:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+        print(f"Cannot import the server as backend.app ({e}); set CI_BENCH_ROOT to the directory containing "
+              f"backend/app", file=sys.stderr)
+        sys.exit(2)
+    report = {"version": _git_version(), "python": platform.python_version(), "platform": platform.platform(),
+              "timestamp": time.time(), "scale": args.scale, "results": {}}
+    try:
+        for name in names:
+            print(f"{name} ...", flush=True)
+            try:
+                report["results"][name] = BENCHMARKS[name](args.scale)
+            except Exception as e:
+                report["results"][name] = {"error": repr(e)}
+            print("  ", json.dumps(report["results"][name]))
+    finally:
+        shutil.rmtree(WORKDIR, ignore_errors=True)
+    with open(args.out, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"wrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            _compare(json.load(f), report)
+    failed = [n for n, result in report["results"].items() if "error" in result]
+    if failed:
+        print("benchmarks failed: " + ",".join(failed), file=sys.stderr)
+        sys.exit(1)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,63 @@
+# bench/lint_async.py
+# Static guard for the API: flags calls to known-blocking functions made directly inside `async def`
+# bodies. Work handed to run_blocking (as a function reference, lambda or nested def) is not flagged.
+#
+#   python bench/lint_async.py main.py        # exit status 1 when something would block the event loop
+import ast
+import sys
+
+BLOCKING = {
+    # job manager / scheduler
+    "create_job", "create_jobs", "update_job", "delete_job", "query_jobs", "list_jobs", "trigger_jobs",
+    "jobs_version", "queue_version", "get_job", "trigger_job", "find_jobs_for_ref",
+    # state store reads/writes (a locked SQLite database waits up to its busy timeout)
+    "get_build", "list_builds", "list_logs", "top_causes",
+    # parsing and serialization of whole documents
+    "parse_pipeline_yaml", "parse_junit_reports", "parse_dependencies_from_pom", "render_latest",
+    # git, subprocesses, network, sleeping
+    "ensure_repo", "acquire_workspace", "clone_or_update_repo", "list_branches", "run_maven_build", "stop_daemons",
+    "subprocess.run", "subprocess.check_output", "subprocess.call", "time.sleep",
+    "requests.get", "requests.post", "requests.put", "requests.delete", "smtplib.SMTP",
+    "notify_build_result", "send_email", "send_slack_message",
+    # secrets: key derivation/decryption and file writes
+    "set_secret", "delete_secret", "list_secrets", "resolve_secrets",
+}
+
+def _callee(node: ast.Call) -> str:
+    f = node.func
+    if isinstance(f, ast.Name):
+        return f.id
+    if isinstance(f, ast.Attribute) and isinstance(f.value, ast.Name):
+        return f"{f.value.id}.{f.attr}"
+    return ""
+
+def _direct_calls(fn: ast.AsyncFunctionDef):
+    """Calls executed on the loop itself: skip nested defs and lambdas, which run wherever they're sent."""
+    stack = list(fn.body)
+    while stack:
+        node = stack.pop()
+        if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda)):
+            continue
+        if isinstance(node, ast.Call):
+            yield node
+        stack.extend(ast.iter_child_nodes(node))
+
+def check(path: str):
+    with open(path) as f:
+        tree = ast.parse(f.read(), path)
+    for fn in ast.walk(tree):
+        if not isinstance(fn, ast.AsyncFunctionDef):
+            continue
+        for call in _direct_calls(fn):
+            name = _callee(call)
+            if name in BLOCKING or name.split(".")[-1] in BLOCKING:
+                yield f"{path}:{call.lineno}: {fn.name}() calls {name}() on the event loop; wrap it in run_blocking"
+
+def main(paths):
+    problems = [p for path in paths for p in check(path)]
+    for p in problems:
+        print(p)
+    return 1 if problems else 0
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv[1:] or ["main.py"]))
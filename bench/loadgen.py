@@ -0,0 +1,171 @@
+# bench/loadgen.py
+# Synthetic traffic against a running server: bursts of GitHub-style /webhook deliveries, manual
+# /jobs/{id}/trigger calls and cron storms. Reports build start latency, queue growth and drop/duplicate counts.
+#
+#   python bench/loadgen.py --jobs 200 --webhook-rate 50 --trigger-rate 20 --duration 60
+#   python bench/loadgen.py --jobs 300 --cron-jobs 300 --duration 90    # 300 jobs firing on the same minute
+import argparse
+import asyncio
+import json
+import random
+import statistics
+import time
+import uuid
+from typing import Dict, List
+
+import httpx
+
+CI_SERVER = "http://localhost:8000"
+
+def push_payload(repo_url: str, branch: str) -> Dict:
+    return {"ref": f"refs/heads/{branch}", "before": "0" * 40, "after": uuid.uuid4().hex + "00000000",
+            "repository": {"clone_url": repo_url, "full_name": "/".join(repo_url[:-4].rsplit("/", 2)[-2:]) if repo_url.endswith(".git") else repo_url},
+            "pusher": {"name": "loadgen"}}
+
+def pull_request_payload(repo_url: str, head: str, base: str = "main") -> Dict:
+    # shape read by get_pull_request_info: pull_request.number/head.ref/base.ref/head.repo.clone_url
+    number = random.randint(1, 100000)
+    return {"action": random.choice(["opened", "synchronize", "reopened"]), "number": number,
+            "pull_request": {"number": number,
+                             "head": {"ref": head, "sha": uuid.uuid4().hex, "repo": {"clone_url": repo_url}},
+                             "base": {"ref": base, "repo": {"clone_url": repo_url}}},
+            "repository": {"clone_url": repo_url}}
+
+class Stats:
+    def __init__(self):
+        self.sent = 0
+        self.errors = 0
+        self.expected_builds: List[str] = []
+        self.queue_samples: List[Dict] = []
+
+async def _paced(rate: float, duration: float, send):
+    """Fire send() at a fixed rate without waiting for responses, so slow replies don't throttle the load."""
+    if rate <= 0:
+        return
+    tasks, interval, start = [], 1.0 / rate, time.monotonic()
+    n = 0
+    while time.monotonic() - start < duration:
+        tasks.append(asyncio.ensure_future(send()))
+        n += 1
+        await asyncio.sleep(max(0.0, start + n * interval - time.monotonic()))
+    await asyncio.gather(*tasks)
+
+async def create_jobs(client: httpx.AsyncClient, args) -> List[Dict]:
+    jobs = []
+    for i in range(args.jobs):
+        cfg = {"name": f"loadgen-{i}", "labels": ["loadgen"],
+               "repo_url": args.repo_url or f"https://github.com/loadgen/repo{i % args.repos}.git",
+               "branches": ["main", "feature/*"],
+               "pipeline": {"name": "stub", "stages": [{"name": "noop", "run": "true"}]}}
+        if i < args.cron_jobs:
+            cfg["schedule_cron"] = args.cron
+        r = await client.post("/jobs", json=cfg)
+        r.raise_for_status()
+        jobs.append(r.json()["job"])
+    return jobs
+
+async def run(args):
+    stats = Stats()
+    limits = httpx.Limits(max_connections=args.concurrency)
+    async with httpx.AsyncClient(base_url=args.server, limits=limits, timeout=30) as client:
+        jobs = await create_jobs(client, args)
+        repos = sorted({j["repo_url"] for j in jobs})
+        headers = {"X-Webhook-Token": args.token}
+
+        async def send_webhook():
+            repo = random.choice(repos)
+            branch = random.choice(["main", "feature/login", "feature/cache", "release/1.0"])
+            payload = pull_request_payload(repo, branch) if random.random() < args.pr_ratio else push_payload(repo, branch)
+            await _send(client.post("/webhook", json=payload, headers=headers), stats)
+
+        async def send_trigger():
+            job = random.choice(jobs)
+            await _send(client.post(f"/jobs/{job['id']}/trigger", json={"LOADGEN": "1"}), stats)
+
+        async def sample_queue():
+            start = time.monotonic()
+            while time.monotonic() - start < args.duration + args.drain:
+                r = await client.get("/queue")
+                stats.queue_samples.append({"t": round(time.monotonic() - start, 2), "length": r.json()["length"]})
+                await asyncio.sleep(1)
+
+        t0 = time.time()
+        await asyncio.gather(_paced(args.webhook_rate, args.duration, send_webhook),
+                             _paced(args.trigger_rate, args.duration, send_trigger),
+                             sample_queue())
+        report = await collect(client, jobs, stats, t0)
+        for job in jobs:
+            await client.delete(f"/jobs/{job['id']}")
+    return report
+
+async def _send(request, stats: Stats):
+    stats.sent += 1
+    try:
+        r = await request
+        r.raise_for_status()
+    except httpx.HTTPError:
+        stats.errors += 1
+        return
+    body = r.json()
+    stats.expected_builds.extend(body.get("builds") or ([body["build_id"]] if "build_id" in body else []))
+
+async def collect(client: httpx.AsyncClient, jobs: List[Dict], stats: Stats, t0: float) -> Dict:
+    observed = {}
+    for job in jobs:
+        r = await client.get("/builds", params={"job_id": job["id"], "limit": 100000})
+        for b in r.json()["builds"]:
+            if b["created_at"] >= t0:
+                observed[b["id"]] = b
+    expected = set(stats.expected_builds)
+    latencies = [b["started_at"] - b["created_at"] for b in observed.values() if b.get("started_at")]
+    lengths = [s["length"] for s in stats.queue_samples]
+    elapsed = max((b.get("started_at") or 0) for b in observed.values()) - t0 if observed else 0
+    return {
+        "requests_sent": stats.sent,
+        "request_errors": stats.errors,
+        "builds_acknowledged": len(expected),
+        "builds_observed": len(observed),
+        "dropped": len(expected - observed.keys()),
+        # builds nobody asked for in this run: cron fires, or duplicate scheduling across server processes
+        "unrequested": len(observed.keys() - expected),
+        "never_started": sum(1 for b in observed.values() if not b.get("started_at")),
+        "start_latency_s": _summary(latencies),
+        "builds_started_per_min": round(len(latencies) / elapsed * 60, 1) if elapsed > 0 else None,
+        "queue_length": {"max": max(lengths, default=0), "final": lengths[-1] if lengths else 0,
+                         "samples": stats.queue_samples},
+    }
+
+def _summary(samples: List[float]) -> Dict:
+    if not samples:
+        return {}
+    samples = sorted(samples)
+    pick = lambda q: round(samples[min(len(samples) - 1, int(q * len(samples)))], 4)
+    return {"p50": pick(0.5), "p90": pick(0.9), "p99": pick(0.99), "max": round(samples[-1], 4),
+            "mean": round(statistics.mean(samples), 4)}
+
+def main():
+    ap = argparse.ArgumentParser(description="Synthetic webhook/trigger/cron load for the CI server")
+    ap.add_argument("--server", default=CI_SERVER)
+    ap.add_argument("--token", default="changeme", help="X-Webhook-Token (settings.SECRET_TOKEN)")
+    ap.add_argument("--jobs", type=int, default=100)
+    ap.add_argument("--repos", type=int, default=10, help="distinct repo URLs the jobs are spread over")
+    ap.add_argument("--repo-url", help="point every job at one real (e.g. local bare) repo so builds can run")
+    ap.add_argument("--webhook-rate", type=float, default=20, help="webhook deliveries per second")
+    ap.add_argument("--pr-ratio", type=float, default=0.3, help="share of webhooks that are pull_request events")
+    ap.add_argument("--trigger-rate", type=float, default=5, help="manual triggers per second")
+    ap.add_argument("--cron-jobs", type=int, default=0, help="how many of the jobs get --cron")
+    ap.add_argument("--cron", default="* * * * *")
+    ap.add_argument("--duration", type=float, default=30, help="seconds of load")
+    ap.add_argument("--drain", type=float, default=15, help="seconds to keep sampling the queue afterwards")
+    ap.add_argument("--concurrency", type=int, default=100)
+    ap.add_argument("--out", help="write the report JSON here as well")
+    args = ap.parse_args()
+    report = asyncio.run(run(args))
+    text = json.dumps(report, indent=2)
+    print(text)
+    if args.out:
+        with open(args.out, "w") as f:
+            f.write(text)
+
+if __name__ == "__main__":
+    main()
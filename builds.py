@@ -0,0 +1,34 @@
+# backend/app/builds.py
+# Build records: one per enqueued job run, holding status and the aggregated pipeline result.
+# Stored in the shared state store so every server process sees the same builds.
+import time
+import uuid
+from typing import Dict, Any, List, Optional, Tuple
+from .state_store import get_store
+
+def new_build(job_id: str, params: Dict[str, str]) -> Dict[str, Any]:
+    """A QUEUED build record, not yet stored."""
+    return {"id": str(uuid.uuid4()), "job_id": job_id, "params": params, "status": "QUEUED",
+            "created_at": time.time(), "started_at": None, "finished_at": None, "result": None,
+            "failure_cause": None}
+
+def create_build(job_id: str, params: Dict[str, str]) -> Dict[str, Any]:
+    build = new_build(job_id, params)
+    get_store().build_put(build)
+    return build
+
+def update_build(build_id: str, **fields) -> Optional[Dict[str, Any]]:
+    return get_store().build_update(build_id, fields)
+
+def get_build(build_id: str) -> Optional[Dict[str, Any]]:
+    return get_store().build_get(build_id)
+
+def delete_build(build_id: str) -> bool:
+    return get_store().build_delete(build_id)
+
+def snapshot_builds() -> List[Tuple[str, str, str, Optional[float], float]]:
+    """(id, job_id, status, finished_at, created_at) for every build, copied under one short lock hold."""
+    return get_store().build_snapshot()
+
+def list_builds(job_id: Optional[str] = None, limit: int = 50) -> List[Dict[str, Any]]:
+    return get_store().build_list(job_id, limit)
@@ -0,0 +1,92 @@
+# backend/app/pipeline/conditions.py
+# `when:` conditions on stages. A condition is compiled once (branch globs and changeset globs into one
+# regex each, the expression into a code object after an AST whitelist check) and cached, so per build the
+# engine only runs a few regex matches and one eval against a namespace with no builtins.
+import ast
+import fnmatch
+import functools
+import re
+import subprocess
+from typing import Dict, List, Optional, Pattern
+from ..models import WhenSpec
+
+class ConditionError(Exception):
+    pass
+
+_NAMES = {"params", "branch", "base_branch"}
+_NODES = (ast.Expression, ast.BoolOp, ast.And, ast.Or, ast.UnaryOp, ast.Not, ast.Compare, ast.Eq, ast.NotEq,
+          ast.Lt, ast.LtE, ast.Gt, ast.GtE, ast.In, ast.NotIn, ast.Name, ast.Load, ast.Constant, ast.Subscript,
+          ast.List, ast.Tuple) + ((ast.Index,) if hasattr(ast, "Index") else ())
+
+class _Params(dict):
+    def __missing__(self, key):
+        return ""  # unset parameters compare as empty strings instead of raising
+
+def _compile_expression(expr: str):
+    try:
+        tree = ast.parse(expr, mode="eval")
+    except SyntaxError as e:
+        raise ConditionError(f"Invalid when expression {expr!r}: {e.msg}")
+    for node in ast.walk(tree):
+        if not isinstance(node, _NODES):
+            raise ConditionError(f"Unsupported syntax in when expression {expr!r}: {type(node).__name__}")
+        if isinstance(node, ast.Name) and node.id not in _NAMES:
+            raise ConditionError(f"Unknown name '{node.id}' in when expression; use {sorted(_NAMES)}")
+        if isinstance(node, ast.Subscript) and not (isinstance(node.value, ast.Name) and node.value.id == "params"):
+            raise ConditionError(f"Only params[...] may be subscripted in when expression {expr!r}")
+    return compile(tree, "<when>", "eval")
+
+def _glob_regex(patterns: List[str]) -> Optional[Pattern]:
+    return re.compile("|".join(fnmatch.translate(p) for p in patterns)) if patterns else None
+
+class Condition:
+    def __init__(self, branch: List[str], expression: Optional[str], changeset: List[str]):
+        self.branch = _glob_regex(branch)
+        self.expression = _compile_expression(expression) if expression else None
+        self.changeset = _glob_regex(changeset)
+
+    def skip_reason(self, params: Dict[str, str], branch: Optional[str], base_branch: Optional[str],
+                    changed: Optional[List[str]]) -> Optional[str]:
+        """Why the stage should not run, or None when every clause holds."""
+        if self.branch and not (branch and self.branch.match(branch)):
+            return f"branch {branch or '(unknown)'} does not match"
+        if self.expression:
+            ns = {"params": _Params(params or {}), "branch": branch or "", "base_branch": base_branch or ""}
+            try:
+                ok = eval(self.expression, {"__builtins__": {}}, ns)
+            except Exception as e:
+                return f"expression failed: {e}"
+            if not ok:
+                return "expression is false"
+        # an unknown changeset (no history to diff against) runs the stage rather than risk skipping it
+        if self.changeset and changed is not None and not any(self.changeset.match(f) for f in changed):
+            return "no matching changes"
+        return None
+
+@functools.lru_cache(maxsize=1024)
+def _compile(branch: tuple, expression: Optional[str], changeset: tuple) -> Condition:
+    return Condition(list(branch), expression, list(changeset))
+
+def compile_when(when: Optional[WhenSpec]) -> Optional[Condition]:
+    if when is None:
+        return None
+    return _compile(tuple(when.branch), when.expression, tuple(when.changeset))
+
+def changed_files(repo_path: str, base_branch: Optional[str] = None, before: Optional[str] = None) -> Optional[List[str]]:
+    """
+    Files changed by the build: against the push's previous SHA when known, else against the merge base
+    with the PR target (or the default branch). None when the history needed for the diff is unavailable.
+    """
+    def git(*args):
+        return subprocess.run(["git", *args], cwd=repo_path, capture_output=True, text=True, check=True).stdout.strip()
+    try:
+        head = git("rev-parse", "HEAD")
+        if before and before.strip("0"):
+            base = before
+        else:
+            base = git("merge-base", "HEAD", f"origin/{base_branch}" if base_branch else "origin/HEAD")
+        if base == head:
+            base = "HEAD~1"  # building the base branch itself: the diff is the tip commit
+        return [f for f in git("diff", "--name-only", base, "HEAD").splitlines() if f]
+    except (subprocess.CalledProcessError, OSError):
+        return None
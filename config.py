@@ -1,15 +1,77 @@
 # backend/app/config.py
 from pydantic import BaseSettings
+from typing import Dict, List
 
 class Settings(BaseSettings):
     APP_NAME: str = "MiniCI"
     HOST: str = "0.0.0.0"
     PORT: int = 8000
     REPO_BASE_PATH: str = "/tmp/ci_repos"
+    WORKSPACE_POOL_SIZE: int = 2  # idle workspaces kept per repository
+    WORKSPACE_DISK_HIGH_WATERMARK: float = 0.90  # evict idle workspaces (LRU) above this disk usage
+    WORKSPACE_PREWARM: bool = True  # clone idle workspaces as soon as a job for a new repository appears
     AGENT_POLL_INTERVAL: int = 3  # seconds
+    # variables stages inherit from the agent process; everything else starts unset
+    AGENT_ENV_INHERIT: List[str] = ["PATH", "HOME", "USER", "LOGNAME", "SHELL", "LANG", "LC_ALL", "TZ", "TMPDIR",
+                                    "JAVA_HOME", "MAVEN_HOME", "M2_HOME", "MAVEN_OPTS", "GRADLE_HOME",
+                                    "SSL_CERT_FILE", "SSL_CERT_DIR", "HTTP_PROXY", "HTTPS_PROXY", "NO_PROXY"]
+    AGENT_ENV: Dict[str, str] = {}  # fixed values added on top of the inherited ones
+    TOOLCHAIN_JDK_DIRS: List[str] = ["/usr/lib/jvm", "/Library/Java/JavaVirtualMachines", "/opt/java"]
     SMTP_HOST: str = "localhost"
     SMTP_PORT: int = 1025
     SLACK_WEBHOOK_URL: str = ""
     SECRET_TOKEN: str = "changeme"  # for simple webhook auth
+    SCHEDULER_COALESCE: bool = True  # collapse runs missed during downtime into one
+    SCHEDULER_MAX_INSTANCES: int = 1
+    SCHEDULER_MISFIRE_GRACE_TIME: int = 300  # seconds a late run may still fire
+    SCHEDULER_JITTER: int = 0  # extra random delay (seconds) added to every cron fire
+    MATRIX_MAX_PARALLEL: int = 4  # matrix cells running at once across all builds
+    MAVEN_USE_DAEMON: bool = True  # run Maven on warm mvnd daemons when mvnd is on PATH
+    MAVEN_DAEMON_PATH: str = "/tmp/ci_mvnd"  # one mvnd daemon storage dir per (agent, JDK)
+    MAVEN_DAEMON_IDLE_TIMEOUT: int = 1800  # seconds before an unused daemon pool is stopped
+    STAGE_TIMEOUT: int = 600  # seconds, when a stage sets no timeout
+    API_BLOCKING_WORKERS: int = 8  # thread pool for blocking work called from async endpoints
+    LOOP_LAG_WARN_SECONDS: float = 0.1  # log when the API event loop is blocked longer than this
+    STAGE_OUTPUT_TAIL: int = 64 * 1024  # bytes of stage output kept on the build record; full log is in the log store
+    LOG_PATH: str = "/tmp/ci_logs"
+    LOG_COMPRESSION: str = "gzip"  # or "zstd" when the zstandard package is installed
+    LOG_CHUNK_SIZE: int = 1024 * 1024  # uncompressed bytes per independently compressed chunk
+    ARTIFACT_PATH: str = "/tmp/ci_artifacts"  # content-addressed blobs + per-build manifests
+    LOG_SEARCH_ENABLED: bool = True
+    LOG_SEARCH_DB: str = "/tmp/ci_logs/search.db"  # SQLite FTS5 index of stage output
+    LOG_SEARCH_BLOCK_SIZE: int = 8192  # bytes of whole lines per indexed block
+    LOG_RETENTION_BUILDS_PER_JOB: int = 50  # newest builds per job are always kept
+    LOG_RETENTION_SUCCESS_DAYS: int = 7
+    LOG_RETENTION_FAILURE_DAYS: int = 30
+    LOG_RETENTION_INTERVAL: int = 300  # seconds between retention sweeps
+    FAILURE_SCAN_BYTES: int = 64 * 1024  # log tail searched for known failure signatures
+    AUTO_RETRY_INFRA_FAILURES: int = 1  # extra attempts for stages failing on OOM/network/repository errors
+    AUTO_RETRY_BACKOFF: float = 5  # seconds before an automatic retry when the stage sets no backoff
+    STATE_BACKEND: str = "memory"  # "sqlite" to share jobs/queue/builds between server processes
+    STATE_DB: str = "/tmp/ci_state/state.db"
+    QUEUE_LEASE_SECONDS: int = 120  # a worker renews its lease every third of this while the build runs
+    SCHEDULER_LEADER_TTL: int = 30  # seconds; the process holding the scheduler lease fires cron jobs
+    SECRETS_PATH: str = "/tmp/ci_secrets/secrets.json"  # name -> Fernet token
+    SECRETS_KEY: str = ""  # Fernet key (cryptography.fernet.Fernet.generate_key()); required to use secrets
+    SECRETS_CACHE_TTL: int = 300  # seconds a decrypted value is reused across builds
+    SECRET_MASK: str = "****"
+    TEMPLATE_PATH: str = "templates"  # local pipeline templates for extends/include
+    TEMPLATE_LIBRARIES: Dict[str, str] = {}  # library name -> git URL, referenced as "<name>@<ref>:<path>"
+    TEMPLATE_CACHE_PATH: str = "/tmp/ci_templates"  # bare clones of template libraries
+    TEMPLATE_REF_TTL: int = 60  # seconds a resolved branch/tag SHA is reused before fetching again
+    RESPONSE_CACHE_SIZE: int = 256  # rendered /queue and /jobs snapshots kept (one per distinct query)
+    RESPONSE_GZIP_MIN_BYTES: int = 1024  # smaller bodies are sent uncompressed even if the client accepts gzip
+    LONG_POLL_MAX_SECONDS: float = 60  # cap on ?wait_for_change=
+    LONG_POLL_INTERVAL: float = 1.0  # how often a long poll re-checks for writes made by other processes
+    STAGE_RESOURCE_LIMITS: Dict[str, int] = {}  # e.g. {"docker": 2}; unlisted resources allow 1 holder
 
-settings = Settings()
+class _LazySettings:
+    """Builds Settings (env parsing and validation) on first attribute access rather than at import."""
+    _instance = None
+
+    def __getattr__(self, name):
+        if _LazySettings._instance is None:
+            _LazySettings._instance = Settings()
+        return getattr(_LazySettings._instance, name)
+
+settings = _LazySettings()
@@ -1,13 +1,42 @@
 #A small DSL: we accept YAML pipeline descriptions (simple, declarative). This parser validates and converts into PipelineSpec.
 # backend/app/pipeline/dsl_parser.py
-import yaml
-from ..models import PipelineSpec, Stage
-from typing import Any, Dict, List
+import hashlib
+import threading
+from collections import OrderedDict
+from pydantic import ValidationError
+from ..models import PipelineSpec, Stage, MatrixSpec, RetrySpec, WhenSpec
+from typing import Any, Dict, List, Optional
+from ..metrics import YAML_PARSE_DURATION
+from .templates import TemplateError, expand, substitute, template_versions
+from .conditions import ConditionError, compile_when
+from ..secret_store import SECRET_REF
+
+MEMO_SIZE = 256
 
 class DSLParseError(Exception):
     pass
 
-def parse_pipeline_yaml(yaml_text: str) -> PipelineSpec:
+# Expanded pipelines keyed by (document hash, template versions, parameters): a job whose templates
+# haven't moved skips YAML parsing, template merging and validation on every build.
+_raw_docs: "OrderedDict[str, Any]" = OrderedDict()
+_expanded: "OrderedDict[tuple, PipelineSpec]" = OrderedDict()
+_memo_lock = threading.Lock()
+
+def _remember(cache: OrderedDict, key, value):
+    with _memo_lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > MEMO_SIZE:
+            cache.popitem(last=False)
+
+def _recall(cache: OrderedDict, key):
+    with _memo_lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def parse_pipeline_yaml(yaml_text: str, params: Optional[Dict[str, str]] = None) -> PipelineSpec:
     """
     Parse a declarative pipeline YAML into PipelineSpec.
     Expected format:
@@ -17,12 +46,62 @@ def parse_pipeline_yaml(yaml_text: str) -> PipelineSpec:
       - name: build
         run: mvn -B -DskipTests package
       - name: test
-        run: mvn test
+        run: [mvn, -B, test]   # exec form: argv run without a shell
+        timeout: 1800      # optional, seconds
+        retry: {count: 2, backoff: 10}   # or just "retry: 2"
+        resources: [db]    # optional, waits for a free "db" slot
+        artifacts: ["target/*.jar", "target/surefire-reports/**"]   # optional, archived after the stage
+        when:              # optional, all clauses must hold or the stage is SKIPPED
+          branch: [main, "release/*"]
+          expression: "params['RUN_IT'] == 'true'"
+          changeset: ["services/api/**"]   # paths changed since the merge base / previous push
+    timeout: 3600          # optional deadline for the whole pipeline
+    matrix:            # optional: run the stages once per combination
+      axes:
+        JDK: [11, 17]
+        DB: [pg, mysql]
+      exclude:
+        - {JDK: 11, DB: mysql}
+      include:
+        - {JDK: 21, DB: pg}
+    extends: lib@main:java/maven.yaml   # optional base template ("<library>@<ref>:<path>" or a TEMPLATE_PATH file)
+    include: [templates/sonar.yaml]     # optional fragments whose stages are merged in
+    parameters: {MODULE: core}          # defaults for {{ MODULE }} placeholders; params passed in win
     """
-    try:
-        raw = yaml.safe_load(yaml_text)
-    except Exception as e:
-        raise DSLParseError(f"YAML parse failed: {e}")
+    with YAML_PARSE_DURATION.time():
+        digest = hashlib.sha1(yaml_text.encode()).hexdigest()
+        raw = _recall(_raw_docs, digest)
+        if raw is None:
+            import yaml  # deferred: only parsing needs it, not every process importing the models
+            try:
+                raw = yaml.safe_load(yaml_text)
+            except Exception as e:
+                raise DSLParseError(f"YAML parse failed: {e}")
+            if not isinstance(raw, dict):
+                raise DSLParseError("Pipeline YAML must contain 'name' and 'stages' fields.")
+            _remember(_raw_docs, digest, raw)
+        try:
+            key = (digest, template_versions(raw), tuple(sorted((params or {}).items())))
+            pipeline = _recall(_expanded, key)
+            if pipeline is None:
+                pipeline = _parse_pipeline(_expand(raw, params or {}))
+                _remember(_expanded, key, pipeline)
+        except TemplateError as e:
+            raise DSLParseError(str(e))
+        except ValidationError as e:
+            # anything the checks above let through still surfaces as a parse error, never a 500
+            raise DSLParseError(f"Invalid pipeline: {e}")
+        return pipeline.copy(deep=True)
+
+def _expand(raw: Dict[str, Any], params: Dict[str, str]) -> Dict[str, Any]:
+    if not any(k in raw for k in ("extends", "include", "parameters")):
+        return raw  # plain pipeline: no placeholders to fill, keep any literal {{ }} in commands as is
+    doc = expand(raw)
+    values = {str(k): str(v) for k, v in (doc.pop("parameters", None) or {}).items()}
+    values.update(params)
+    return substitute(doc, values)
+
+def _parse_pipeline(raw: Dict[str, Any]) -> PipelineSpec:
     if not raw or "stages" not in raw or "name" not in raw:
         raise DSLParseError("Pipeline YAML must contain 'name' and 'stages' fields.")
     stages_raw: List[Dict[str, Any]] = raw.get("stages", [])
@@ -30,6 +109,90 @@ def parse_pipeline_yaml(yaml_text: str) -> PipelineSpec:
     for s in stages_raw:
         if "name" not in s or "run" not in s:
             raise DSLParseError("Each stage must have 'name' and 'run'.")
-        stages.append(Stage(name=s["name"], run=s["run"], env=s.get("env")))
-    pipeline = PipelineSpec(name=raw["name"], agent=raw.get("agent", "local"), stages=stages)
+        if isinstance(s["run"], list):
+            if not s["run"] or not all(isinstance(a, (str, int, float)) for a in s["run"]):
+                raise DSLParseError(f"Stage '{s['name']}': exec-form 'run' must be a non-empty list of strings.")
+            s["run"] = [str(a) for a in s["run"]]
+            if any(SECRET_REF.search(a) for a in s["run"]):
+                # no shell to expand an env var, and a literal value would show up in ps
+                raise DSLParseError(f"Stage '{s['name']}': pass secrets to exec-form commands through 'env'.")
+        where = f"Stage '{s['name']}'"
+        resources = s.get("resources") or []
+        if not isinstance(resources, list) or not all(isinstance(x, str) for x in resources):
+            raise DSLParseError(f"{where}: 'resources' must be a list of names.")
+        stages.append(Stage(name=s["name"], run=s["run"], env=s.get("env"),
+                            timeout=_number(where, "timeout", s.get("timeout"), integer=True),
+                            retry=_parse_retry(where, s.get("retry")), resources=resources,
+                            artifacts=_parse_artifacts(s["name"], s.get("artifacts")),
+                            when=_parse_when(s.get("when"))))
+    matrix = _parse_matrix(raw["matrix"]) if raw.get("matrix") else None
+    pipeline = PipelineSpec(name=raw["name"], agent=raw.get("agent", "local"), stages=stages, matrix=matrix,
+                            timeout=_number("Pipeline", "timeout", raw.get("timeout"), integer=True))
     return pipeline
+
+def _parse_artifacts(stage: str, patterns: Any) -> List[str]:
+    if not patterns:
+        return []
+    if not isinstance(patterns, list) or not all(isinstance(p, str) for p in patterns):
+        raise DSLParseError(f"Stage '{stage}': 'artifacts' must be a list of glob patterns.")
+    for p in patterns:
+        parts = p.replace("\\", "/").split("/")
+        # archiving is limited to the workspace
+        if parts[0] == "" or parts[0].endswith(":") or ".." in parts:
+            raise DSLParseError(f"Stage '{stage}': artifact pattern {p!r} must stay inside the workspace.")
+    return patterns
+
+def _parse_when(w: Any):
+    if w is None:
+        return None
+    if isinstance(w, str):
+        w = {"expression": w}
+    if not isinstance(w, dict) or set(w) - {"branch", "expression", "changeset"}:
+        raise DSLParseError("'when' must be an expression or a mapping of 'branch', 'expression', 'changeset'.")
+    as_list = lambda v: [str(x) for x in ([v] if isinstance(v, str) else v or [])]
+    when = WhenSpec(branch=as_list(w.get("branch")), expression=w.get("expression"),
+                    changeset=as_list(w.get("changeset")))
+    try:
+        compile_when(when)  # compiled (and cached) now so a bad expression fails the parse, not the build
+    except ConditionError as e:
+        raise DSLParseError(str(e))
+    return when
+
+def _number(where: str, key: str, value: Any, integer: bool = False, minimum: float = 1) -> Any:
+    """None, or an int/float >= minimum; anything else (including booleans) is a parse error."""
+    if value is None:
+        return None
+    if isinstance(value, bool) or not isinstance(value, int if integer else (int, float)) or value < minimum:
+        kind = "an integer" if integer else "a number"
+        raise DSLParseError(f"{where}: '{key}' must be {kind} >= {minimum:g}.")
+    return value
+
+def _parse_retry(where: str, r: Any):
+    if r is None:
+        return None
+    if isinstance(r, int) and not isinstance(r, bool):
+        return RetrySpec(count=_number(where, "retry", r, integer=True, minimum=0))
+    if not isinstance(r, dict):
+        raise DSLParseError(f"{where}: 'retry' must be a count or a mapping with 'count' and 'backoff'.")
+    return RetrySpec(count=_number(where, "retry.count", r.get("count", 0), integer=True, minimum=0),
+                     backoff=_number(where, "retry.backoff", r.get("backoff", 0), minimum=0))
+
+def _parse_matrix(m: Any) -> MatrixSpec:
+    if not isinstance(m, dict) or not isinstance(m.get("axes"), dict) or not m["axes"]:
+        raise DSLParseError("'matrix' must contain a non-empty 'axes' mapping.")
+    axes = {}
+    for axis, values in m["axes"].items():
+        if not isinstance(values, list) or not values:
+            raise DSLParseError(f"Matrix axis '{axis}' must be a non-empty list.")
+        axes[str(axis)] = [str(v) for v in values]
+    rules = {}
+    for key in ("include", "exclude"):
+        entries = m.get(key) or []
+        if not isinstance(entries, list) or not all(isinstance(e, dict) for e in entries):
+            raise DSLParseError(f"Matrix '{key}' must be a list of mappings.")
+        rules[key] = [{str(k): str(v) for k, v in e.items()} for e in entries]
+    max_parallel = m.get("max_parallel")
+    if max_parallel is not None and (not isinstance(max_parallel, int) or isinstance(max_parallel, bool)
+                                     or max_parallel < 1):
+        raise DSLParseError("Matrix 'max_parallel' must be a positive integer.")
+    return MatrixSpec(axes=axes, max_parallel=max_parallel, **rules)
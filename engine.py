@@ -3,46 +3,276 @@
 import subprocess
 import shlex
 import asyncio
-from typing import Dict, Any, List
+import os
+import re
+import contextlib
+import itertools
+from typing import Dict, Any, List, Optional, Tuple
 from .dsl_parser import DSLParseError
-from ..models import PipelineSpec, Stage
+from ..models import PipelineSpec, Stage, MatrixSpec
+from ..config import settings
+from ..metrics import PIPELINE_DURATION, STAGE_DURATION
+from ..tracing import span
+from ..log_store import open_log
+from .failure_analyzer import classify
+from .conditions import compile_when, changed_files
+from ..artifacts import collect_artifacts
+from ..workspace import add_cell_checkout, remove_cell_checkout
+from .toolchains import base_env, select_jdk, which
+from ..secret_store import SECRET_REF, MaskSet, referenced_secrets, resolve_secrets, secret_env_name
 import time
 
+_matrix_slots: Optional[asyncio.Semaphore] = None  # shared by every matrix build on the worker loop
+_resource_slots: Dict[str, asyncio.Semaphore] = {}  # named stage resources, created on first use
+
+# shell-form commands made only of plain words skip /bin/sh and are exec'd directly
+_PLAIN_COMMAND = re.compile(r"^[\w./:,+@%-]+(?: +[\w./:,=+@%-]+)*$")
+_SHELL_BUILTINS = {"cd", "export", "exit", "source", ".", "set", "unset", "alias", "exec", "eval", "read", "ulimit",
+                   "umask", "trap", "wait", "shift", "return", "break", "continue", "local", "declare", "typeset",
+                   "readonly", "type", "hash", "command", "builtin", "let", "times"}
+
 class StageResult(dict):
     pass
 
-async def run_stage(stage: Stage, workdir: str, params: Dict[str, str] = None, timeout: int = 600) -> StageResult:
-    env = {}
+def _argv(stage: Stage, secrets: Dict[str, str], path: str) -> Tuple[Optional[List[str]], str]:
+    """(argv to exec, or None to run through the shell; printable command)."""
+    if isinstance(stage.run, list):
+        argv = list(stage.run)
+    else:
+        # secrets reach shell commands as env vars, never spliced into the command line (visible in ps)
+        cmd = SECRET_REF.sub(lambda m: "${" + secret_env_name(m.group(1)) + "}", stage.run)
+        if not _PLAIN_COMMAND.match(cmd.strip()) or cmd.split()[0] in _SHELL_BUILTINS:
+            return None, cmd
+        argv = cmd.split()
+    program = argv[0] if os.sep in argv[0] else which(argv[0], path)
+    if program is None:
+        if isinstance(stage.run, str):
+            return None, cmd  # the shell reports "not found" (exit 127) as it always did
+        program = argv[0]
+    return [program] + argv[1:], " ".join(argv)
+
+async def run_stage(stage: Stage, workdir: str, params: Dict[str, str] = None, timeout: Optional[float] = None,
+                    build_id: Optional[str] = None, log_name: Optional[str] = None,
+                    secrets: Optional[Dict[str, str]] = None, masks: Optional[MaskSet] = None) -> StageResult:
+    if timeout is None:
+        timeout = stage.timeout or settings.STAGE_TIMEOUT
+    secrets = secrets or {}
+    env = base_env()
     if stage.env:
-        env.update(stage.env)
+        env.update({k: SECRET_REF.sub(lambda m: secrets[m.group(1)], v) for k, v in stage.env.items()})
     if params:
         env.update(params)
-    cmd = stage.run
-    # Use shell=True for convenience; in production prefer shlex splitting with proper args.
+    # only the secrets this stage references: other stages' values stay out of its environment
+    own = referenced_secrets(([stage.run] if isinstance(stage.run, str) else []) + list((stage.env or {}).values()))
+    env.update({secret_env_name(n): secrets[n] for n in own if n in secrets})
+    select_jdk(env)
+    argv, cmd = _argv(stage, secrets, env.get("PATH", os.defpath))
     start = time.time()
-    proc = await asyncio.create_subprocess_shell(cmd,
-                                                 cwd=workdir,
-                                                 stdout=asyncio.subprocess.PIPE,
-                                                 stderr=asyncio.subprocess.STDOUT,
-                                                 env={**env},
-                                                 )
     try:
-        stdout, _ = await asyncio.wait_for(proc.communicate(), timeout=timeout)
+        if argv is None:
+            proc = await asyncio.create_subprocess_shell(cmd, cwd=workdir, env=env, stdout=asyncio.subprocess.PIPE,
+                                                         stderr=asyncio.subprocess.STDOUT)
+        else:
+            proc = await asyncio.create_subprocess_exec(*argv, cwd=workdir, env=env, stdout=asyncio.subprocess.PIPE,
+                                                        stderr=asyncio.subprocess.STDOUT)
+    except OSError as e:
+        # exec form has no shell to report a missing/non-executable program
+        STAGE_DURATION.labels("FAILED").observe(time.time() - start)
+        return StageResult(name=stage.name, status="FAILED", duration=time.time() - start, output=f"{cmd}: {e}\n",
+                           rc=127, output_bytes=0, log=None, failure_cause=None)
+    # Output is streamed: every chunk goes to the build's log store, and only a bounded tail stays in memory.
+    log = open_log(build_id, log_name or stage.name) if build_id else None
+    masker = masks.stream() if masks else None
+    tail = bytearray()
+    total = 0
+
+    def emit(data: bytes):
+        if log:
+            log.write(data)
+        tail.extend(data)
+        if len(tail) > 2 * settings.STAGE_OUTPUT_TAIL:
+            del tail[:-settings.STAGE_OUTPUT_TAIL]
+
+    async def pump():
+        nonlocal total
+        while True:
+            chunk = await proc.stdout.read(65536)
+            if not chunk:
+                break
+            total += len(chunk)
+            # masked before anything is stored, so logs, search, results and notifications never see secrets
+            emit(masker.feed(chunk) if masker else chunk)
+        await proc.wait()
+
+    try:
+        await asyncio.wait_for(pump(), timeout=timeout)
+        rc = proc.returncode
+        status = "SUCCESS" if rc == 0 else "FAILED"
     except asyncio.TimeoutError:
         proc.kill()
-        return StageResult(name=stage.name, status="TIMED_OUT", duration=time.time()-start, output="(timeout)")
-    rc = proc.returncode
-    status = "SUCCESS" if rc == 0 else "FAILED"
-    text = stdout.decode(errors="ignore") if stdout else ""
-    return StageResult(name=stage.name, status=status, duration=time.time()-start, output=text, rc=rc)
+        await proc.wait()
+        rc, status = None, "TIMED_OUT"
+        tail.extend(b"\n(timeout)")
+    finally:
+        if masker:
+            emit(masker.flush())
+        if log:
+            log.close()
+    STAGE_DURATION.labels(status).observe(time.time()-start)
+    text = bytes(tail[-settings.STAGE_OUTPUT_TAIL:]).decode(errors="ignore")
+    return StageResult(name=stage.name, status=status, duration=time.time()-start, output=text, rc=rc,
+                       output_bytes=total, log=log_name or stage.name if log else None,
+                       failure_cause=classify(text) if status != "SUCCESS" else None)
+
+@contextlib.asynccontextmanager
+async def _hold_resources(names: List[str]):
+    """Wait for a slot of every named resource; acquired in sorted order so stages cannot deadlock."""
+    async with contextlib.AsyncExitStack() as stack:
+        if names:
+            with span("wait_resources", resources=sorted(set(names))):
+                for name in sorted(set(names)):
+                    if name not in _resource_slots:
+                        _resource_slots[name] = asyncio.Semaphore(settings.STAGE_RESOURCE_LIMITS.get(name, 1))
+                    await stack.enter_async_context(_resource_slots[name])
+        yield
 
-async def run_pipeline(pipeline: PipelineSpec, repo_path: str, params: Dict[str,str]=None) -> Dict[str, Any]:
+async def _run_stage_with_retry(stage: Stage, workdir: str, params: Dict[str,str], deadline: Optional[float],
+                                build_id: Optional[str] = None, cell: str = "",
+                                context: Optional[Dict[str, Any]] = None) -> StageResult:
+    # retries rerun the command in the same workspace rather than requeuing the build;
+    # failures classified as infrastructure (OOM, network, repository) get AUTO_RETRY_INFRA_FAILURES extra tries
+    configured = stage.retry.count if stage.retry else 0
+    backoff = stage.retry.backoff if stage.retry else 0
+    infra_retries = 0
+    attempt = 0
+    context = context or {}
+    while True:
+        timeout = stage.timeout or settings.STAGE_TIMEOUT
+        if deadline is not None:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                return StageResult(name=stage.name, status="TIMED_OUT", duration=0.0,
+                                   output="(pipeline deadline exceeded)", attempts=attempt)
+            timeout = min(timeout, remaining)
+        # one log per stage, matrix cell and attempt: "test", "test@JDK=17", "test#2"
+        log_name = stage.name + (f"@{cell}" if cell else "") + (f"#{attempt + 1}" if attempt else "")
+        async with _hold_resources(stage.resources):
+            with span(f"stage:{stage.name}", attempt=attempt + 1) as s:
+                r = await run_stage(stage, workdir, params=params, timeout=timeout, build_id=build_id, log_name=log_name,
+                                    secrets=context.get("secrets"), masks=context.get("masks"))
+                if s is not None:
+                    s["status"] = "OK" if r["status"] == "SUCCESS" else r["status"]
+        if stage.artifacts and build_id and r["status"] != "TIMED_OUT":
+            # archived for failed stages too (test reports matter most then); hashing/copying runs off the loop
+            with span("artifacts", patterns=stage.artifacts):
+                r["artifacts"] = await asyncio.get_running_loop().run_in_executor(
+                    None, collect_artifacts, build_id, workdir, stage.artifacts, cell)
+        r["attempts"] = attempt + 1
+        if r["status"] == "SUCCESS":
+            return r
+        cause = r.get("failure_cause")
+        if attempt >= configured:
+            if not cause or cause["kind"] != "infra" or infra_retries >= settings.AUTO_RETRY_INFRA_FAILURES:
+                return r
+            infra_retries += 1
+            backoff = backoff or settings.AUTO_RETRY_BACKOFF
+        delay = backoff * (2 ** attempt)
+        if deadline is not None:
+            delay = min(delay, max(0.0, deadline - time.monotonic()))
+        await asyncio.sleep(delay)
+        attempt += 1
+
+async def _run_stages(stages: List[Stage], repo_path: str, params: Dict[str,str]=None,
+                      deadline: Optional[float] = None, build_id: Optional[str] = None,
+                      cell: str = "", context: Optional[Dict[str, Any]] = None) -> Tuple[str, List[Dict[str,Any]]]:
     results: List[Dict[str,Any]] = []
     overall = "SUCCESS"
-    for stage in pipeline.stages:
-        r = await run_stage(stage, repo_path, params=params)
+    context = context or {}
+    for stage in stages:
+        condition = compile_when(stage.when)
+        if condition:
+            reason = condition.skip_reason(params, context.get("branch"), context.get("base_branch"),
+                                           context.get("changed_files"))
+            if reason:
+                results.append(StageResult(name=stage.name, status="SKIPPED", duration=0.0, output="", reason=reason))
+                continue
+        r = await _run_stage_with_retry(stage, repo_path, params, deadline, build_id, cell, context)
         results.append(r)
         if r.get("status") != "SUCCESS":
-            overall = "FAILED"
+            overall = "TIMED_OUT" if r.get("status") == "TIMED_OUT" else "FAILED"
             break
-    return {"pipeline": pipeline.name, "status": overall, "stages": results}
+    return overall, results
+
+def expand_matrix(matrix: MatrixSpec) -> List[Dict[str, str]]:
+    """Cartesian product of the axes, minus exclude matches, plus include entries."""
+    names = list(matrix.axes)
+    combos = [dict(zip(names, values)) for values in itertools.product(*(matrix.axes[n] for n in names))]
+    combos = [c for c in combos
+              if not any(all(c.get(k) == v for k, v in ex.items()) for ex in matrix.exclude)]
+    for inc in matrix.include:
+        if inc not in combos:
+            combos.append(dict(inc))
+    return combos
+
+async def _run_matrix(pipeline: PipelineSpec, repo_path: str, params: Dict[str,str]=None,
+                      deadline: Optional[float] = None, build_id: Optional[str] = None,
+                      context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    global _matrix_slots
+    if _matrix_slots is None:
+        _matrix_slots = asyncio.Semaphore(settings.MATRIX_MAX_PARALLEL)
+    local_slots = asyncio.Semaphore(pipeline.matrix.max_parallel or settings.MATRIX_MAX_PARALLEL)
+
+    combos = expand_matrix(pipeline.matrix)
+    loop = asyncio.get_running_loop()
+
+    async def run_cell(lane: int, combo: Dict[str, str]) -> Dict[str, Any]:
+        # each cell works in its own worktree of the build's checkout; axis values reach stages as env vars
+        async with local_slots, _matrix_slots:
+            with span("matrix_cell", lane=lane, axes=combo):
+                workdir = repo_path
+                if len(combos) > 1:
+                    with span("cell_checkout"):
+                        workdir = await loop.run_in_executor(None, add_cell_checkout, repo_path)
+                try:
+                    status, stages = await _run_stages(pipeline.stages, workdir, params={**(params or {}), **combo},
+                                                       deadline=deadline, build_id=build_id,
+                                                       cell=",".join(f"{k}={v}" for k, v in combo.items()),
+                                                       context=context)
+                finally:
+                    if workdir != repo_path:
+                        await loop.run_in_executor(None, remove_cell_checkout, repo_path, workdir)
+        return {"combination": combo, "status": status, "stages": stages}
+
+    cells = await asyncio.gather(*(run_cell(i + 1, c) for i, c in enumerate(combos)))
+    statuses = {c["status"] for c in cells} - {"SUCCESS"}
+    # TIMED_OUT only when every unsuccessful cell hit its deadline; any other failure makes the build FAILED
+    overall = "SUCCESS" if not statuses else "TIMED_OUT" if statuses == {"TIMED_OUT"} else "FAILED"
+    return {"pipeline": pipeline.name, "status": overall, "stages": [], "matrix": cells}
+
+async def run_pipeline(pipeline: PipelineSpec, repo_path: str, params: Dict[str,str]=None,
+                       build_id: Optional[str] = None, context: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """context: what triggered the build ("branch", "base_branch", "before"), used by `when:` conditions."""
+    start = time.monotonic()
+    deadline = start + pipeline.timeout if pipeline.timeout else None
+    context = dict(context or {})
+    with span("pipeline", pipeline=pipeline.name):
+        names = referenced_secrets([s.run for s in pipeline.stages if isinstance(s.run, str)] +
+                                   [v for s in pipeline.stages for v in (s.env or {}).values()])
+        if names:
+            # decrypted once for the whole build; every stage and matrix cell shares the values and mask set
+            with span("secrets", count=len(names)):
+                context["secrets"] = resolve_secrets(names)
+                context["masks"] = MaskSet(context["secrets"].values())
+        if any(s.when and s.when.changeset for s in pipeline.stages):
+            # one diff per build, shared by every stage and matrix cell
+            with span("changeset"):
+                context["changed_files"] = await asyncio.get_running_loop().run_in_executor(
+                    None, changed_files, repo_path, context.get("base_branch"), context.get("before"))
+        if pipeline.matrix:
+            result = await _run_matrix(pipeline, repo_path, params, deadline, build_id, context)
+        else:
+            overall, results = await _run_stages(pipeline.stages, repo_path, params, deadline, build_id,
+                                                 context=context)
+            result = {"pipeline": pipeline.name, "status": overall, "stages": results}
+    PIPELINE_DURATION.labels(result["status"]).observe(time.monotonic() - start)
+    return result
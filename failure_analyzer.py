@@ -0,0 +1,75 @@
+# backend/app/pipeline/failure_analyzer.py
+# Classifies failed stages from their log tail. All known signatures are compiled into one alternation
+# with a named group each, so the tail is scanned once no matter how many signatures there are.
+# Matches are normalized (numbers, hashes, paths, quoted values stripped) into a stable fingerprint.
+import hashlib
+import re
+from typing import Any, Dict, List, Optional
+from ..config import settings
+from ..state_store import get_store
+
+# (category, kind, pattern); earlier entries win when several match, so root causes like OOM or an
+# unreachable repository outrank the compile/test errors they tend to trigger.
+SIGNATURES = [
+    ("oom", "infra", r"java\.lang\.OutOfMemoryError[^\n]*|Cannot allocate memory[^\n]*|Killed process \d+[^\n]*"),
+    ("disk_full", "infra", r"No space left on device[^\n]*"),
+    ("network_timeout", "infra", r"(?:Connect|Connection|Read) timed out[^\n]*|Could not resolve host[^\n]*"
+                                 r"|Temporary failure in name resolution[^\n]*|Connection reset by peer[^\n]*"),
+    ("maven_resolution", "infra", r"Could not resolve dependencies for project[^\n]*"
+                                  r"|Could not transfer artifact[^\n]*|Failed to read artifact descriptor[^\n]*"),
+    ("compile_error", "code", r"COMPILATION ERROR[^\n]*|\[ERROR\] [^\n]*\.java:\[\d+,\d+\][^\n]*"
+                              r"|[^\s:]+\.(?:c|cc|cpp|go|rs|ts):\d+(?::\d+)?: error[^\n]*"),
+    ("test_failure", "code", r"Tests run: \d+, Failures: [1-9][^\n]*|There are test failures[^\n]*"
+                             r"|FAILED [^\s]+::[^\s]+[^\n]*"),
+]
+
+_MATCHER = re.compile("|".join(f"(?P<{cat}>{pattern})" for cat, _, pattern in SIGNATURES))
+_PRIORITY = {cat: i for i, (cat, _, _) in enumerate(SIGNATURES)}
+_KIND = {cat: kind for cat, kind, _ in SIGNATURES}
+
+_NORMALIZERS = [
+    (re.compile(r"\b[0-9a-f]{7,40}\b|\b[0-9a-f]{8}-[0-9a-f-]{27}\b", re.I), "<hex>"),
+    (re.compile(r"(?:/[\w.@-]+)+|(?:[A-Za-z]:)?(?:\\[\w.@-]+)+"), "<path>"),
+    (re.compile(r"'[^']*'|\"[^\"]*\""), "<str>"),
+    (re.compile(r"\d+(?:\.\d+)*"), "<n>"),
+    (re.compile(r"\s+"), " "),
+]
+
+def normalize(message: str) -> str:
+    for rx, repl in _NORMALIZERS:
+        message = rx.sub(repl, message)
+    return message.strip()
+
+def classify(log_tail: str) -> Optional[Dict[str, str]]:
+    """Best matching failure signature in the tail of a stage log, or None when nothing is recognized."""
+    best = None
+    for m in _MATCHER.finditer(log_tail[-settings.FAILURE_SCAN_BYTES:]):
+        category = m.lastgroup
+        if best is None or _PRIORITY[category] < _PRIORITY[best.lastgroup]:
+            best = m
+            if _PRIORITY[category] == 0:
+                break
+    if best is None:
+        return None
+    category = best.lastgroup
+    message = best.group().strip()[:300]
+    signature = normalize(message)
+    return {"category": category, "kind": _KIND[category], "message": message, "signature": signature,
+            "fingerprint": hashlib.sha1(f"{category}:{signature}".encode()).hexdigest()[:12]}
+
+def build_failure_cause(result: Dict[str, Any]) -> Optional[Dict[str, str]]:
+    """Cause of the first failed stage in a pipeline result (matrix cells included)."""
+    stage_lists: List[List[Dict[str, Any]]] = [result.get("stages") or []]
+    stage_lists += [cell.get("stages") or [] for cell in result.get("matrix") or []]
+    for stages in stage_lists:
+        for stage in stages:
+            if stage.get("failure_cause"):
+                return stage["failure_cause"]
+    return None
+
+def record_cause(cause: Dict[str, str], build_id: str):
+    # totals live in the state store so every server process counts and reports the same causes
+    get_store().cause_record(cause, build_id)
+
+def top_causes(limit: int = 20, category: Optional[str] = None) -> List[Dict[str, Any]]:
+    return get_store().cause_top(limit, category)
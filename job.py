@@ -1,33 +1,431 @@
 # backend/app/job_manager.py
-# Supports job creation, parameterized jobs, schedule (cron via APScheduler), and storing jobs in-memory (for demo). Real system would persist.
+# Supports job creation, parameterized jobs, schedule (cron via APScheduler). Job configs are written through to
+# the shared state store; _jobs and the indexes are this process's cache, reloaded when the store's jobs
+# version moves (another server process changed a job). Only the holder of the "scheduler" lease runs cron.
+import os
+import time
 import uuid
-from typing import Dict, Optional, List
+import re
+import zlib
+import fnmatch
+from typing import Dict, Iterator, Optional, List, Set, Tuple, Pattern, TYPE_CHECKING
 from .models import JobConfig, PipelineSpec
-from apscheduler.schedulers.background import BackgroundScheduler
-from apscheduler.triggers.cron import CronTrigger
-from .queue import enqueue_job
+from .queue import enqueue_job, enqueue_jobs
+from .state_store import get_store
+from .response_cache import notify_changed
+from .pipeline.dsl_parser import parse_pipeline_yaml, DSLParseError
+from .config import settings
+from .workspace import prewarm
 import threading
 
+if TYPE_CHECKING:
+    from apscheduler.triggers.cron import CronTrigger
+
 _jobs: Dict[str, JobConfig] = {}
-_scheduler = BackgroundScheduler()
-_scheduler.start()
+_jobs_lock = threading.RLock()
+_scheduler = None  # APScheduler is imported and started on first use (see get_scheduler), not at import
+_jobs_version = 0  # store version _jobs reflects
+_instance_id = f"{os.getpid()}:{uuid.uuid4().hex[:8]}"
+_leading = False  # this process holds the scheduler lease
+_election_thread = None
+
+# Secondary indexes, kept in sync with _jobs on create/update/delete so lookups never scan every job.
+_seq: Dict[str, int] = {}  # job id -> insertion number, gives filtered listings a stable order
+_next_seq = 0
+_by_name: Dict[str, Set[str]] = {}
+_by_label: Dict[str, Set[str]] = {}
+_by_repo: Dict[str, Set[str]] = {}
+# literal branch filters: (repo, branch) -> job ids
+_by_repo_branch: Dict[Tuple[str, str], Set[str]] = {}
+# jobs with glob branch filters (or none at all): repo -> job id -> compiled pattern (None = any branch)
+_repo_wildcards: Dict[str, Dict[str, Optional[Pattern]]] = {}
+_prewarmed: Set[str] = set()  # repos whose workspace pool this process has started filling
+
+_GLOB_CHARS = re.compile(r"[*?\[]")
+
+# minute, hour, day of month, month, day of week; H in the day field stays within 1-28 like Jenkins
+_CRON_RANGES = [(0, 59), (0, 23), (1, 28), (1, 12), (0, 6)]
+_HASH_TOKEN = re.compile(r"^H(?:\((\d+)-(\d+)\))?(?:/(\d+))?$")
+
+def expand_hash_cron(expr: str, seed: str) -> str:
+    """
+    Expand Jenkins-style H tokens (H, H(lo-hi), H/step, H(lo-hi)/step) into concrete values
+    derived from seed, so jobs sharing a nominal schedule spread out but each keeps a stable slot.
+    """
+    fields = expr.split()
+    if len(fields) != 5:
+        raise ValueError(f"Cron expression must have 5 fields: {expr!r}")
+    out = []
+    for i, field in enumerate(fields):
+        h = zlib.crc32(f"{seed}:{i}".encode())
+        parts = []
+        for part in field.split(","):
+            m = _HASH_TOKEN.match(part)
+            if not m:
+                parts.append(part)
+                continue
+            lo, hi = (int(m.group(1)), int(m.group(2))) if m.group(1) else _CRON_RANGES[i]
+            if hi < lo:
+                raise ValueError(f"Invalid H range in {expr!r}")
+            if m.group(3):
+                step = int(m.group(3))
+                parts.append(f"{lo + h % min(step, hi - lo + 1)}-{hi}/{step}")
+            else:
+                parts.append(str(lo + h % (hi - lo + 1)))
+        out.append(",".join(parts))
+    return " ".join(out)
+
+def get_scheduler():
+    global _scheduler
+    if _scheduler is None:
+        with _jobs_lock:
+            if _scheduler is None:
+                from apscheduler.schedulers.background import BackgroundScheduler
+                _scheduler = BackgroundScheduler()
+                _scheduler.start()
+    return _scheduler
+
+def shutdown_scheduler():
+    global _scheduler, _leading
+    with _jobs_lock:
+        if _scheduler is not None:
+            _scheduler.shutdown(wait=False)
+            _scheduler = None
+        if _leading:
+            # hand cron over to another process right away instead of after the lease expires
+            _leading = False
+            get_store().release_lease("scheduler", _instance_id)
+
+def _cron_trigger(job: JobConfig) -> "CronTrigger":
+    from apscheduler.triggers.cron import CronTrigger
+    minute, hour, day, month, day_of_week = expand_hash_cron(job.schedule_cron, job.name).split()
+    return CronTrigger(minute=minute, hour=hour, day=day, month=month, day_of_week=day_of_week,
+                       jitter=settings.SCHEDULER_JITTER or None)
+
+def _check_leadership() -> bool:
+    """Take or renew the scheduler lease; the process that wins schedules every cron job, a loser stops its scheduler."""
+    global _leading
+    won = get_store().acquire_lease("scheduler", _instance_id, settings.SCHEDULER_LEADER_TTL)
+    with _jobs_lock:
+        if won and not _leading:
+            _leading = True
+            for job in list(_jobs.values()):
+                if job.schedule_cron:
+                    _add_cron(job, _cron_trigger(job))
+        elif not won and _leading:
+            _leading = False
+            shutdown_scheduler()
+    return won
+
+def _fire(job_id: str):
+    # re-checked at fire time so a process that lost the lease while stalled cannot double-fire
+    if _check_leadership():
+        enqueue_job(job_id, {})
+
+def _is_leader() -> bool:
+    # cached: lease writes belong to _election_loop, never to paths holding _jobs_lock. A memory store is one
+    # process, which always leads.
+    return _leading or settings.STATE_BACKEND == "memory"
+
+def _schedule(job: JobConfig, trigger: Optional["CronTrigger"]):
+    """Keep the APScheduler entry (id == job id) in sync with the job definition."""
+    if trigger is None:
+        _unschedule(job.id)
+        return
+    if _is_leader():
+        _add_cron(job, trigger)
+
+def _add_cron(job: JobConfig, trigger: "CronTrigger"):
+    get_scheduler().add_job(_fire, trigger=trigger, args=[job.id], id=job.id, replace_existing=True,
+                            coalesce=settings.SCHEDULER_COALESCE,
+                            max_instances=settings.SCHEDULER_MAX_INSTANCES,
+                            misfire_grace_time=settings.SCHEDULER_MISFIRE_GRACE_TIME)
+
+def _unschedule(job_id: str):
+    if _scheduler is not None and _scheduler.get_job(job_id):
+        _scheduler.remove_job(job_id)
+
+def normalize_repo_url(url: str) -> str:
+    """Reduce https/ssh/.git spellings of the same repository to one key."""
+    u = url.strip().lower()
+    if u.startswith("git@"):
+        u = u[4:].replace(":", "/", 1)
+    u = re.sub(r"^[a-z+]+://", "", u)
+    u = u.split("@", 1)[-1]
+    u = u.rstrip("/")
+    if u.endswith(".git"):
+        u = u[:-4]
+    return u
+
+def _branch_name(ref: str) -> str:
+    return ref[len("refs/heads/"):] if ref.startswith("refs/heads/") else ref
+
+def _index(job: JobConfig):
+    global _next_seq
+    if job.id not in _seq:
+        _seq[job.id] = _next_seq
+        _next_seq += 1
+    _by_name.setdefault(job.name, set()).add(job.id)
+    for label in job.labels or []:
+        _by_label.setdefault(label, set()).add(job.id)
+    if not job.repo_url:
+        return
+    repo = normalize_repo_url(job.repo_url)
+    _by_repo.setdefault(repo, set()).add(job.id)
+    if job.branches is None:
+        _repo_wildcards.setdefault(repo, {})[job.id] = None
+        return
+    globs = [p for p in job.branches if _GLOB_CHARS.search(p)]
+    for pattern in job.branches:
+        if pattern not in globs:
+            _by_repo_branch.setdefault((repo, pattern), set()).add(job.id)
+    if globs:
+        # several globs on one job are folded into a single alternation
+        _repo_wildcards.setdefault(repo, {})[job.id] = re.compile("|".join(fnmatch.translate(p) for p in globs))
+
+def _discard(index: Dict, key, job_id: str):
+    ids = index.get(key)
+    if ids is None:
+        return
+    if isinstance(ids, set):
+        ids.discard(job_id)
+    else:
+        ids.pop(job_id, None)
+    if not ids:
+        del index[key]
+
+def _unindex(job: JobConfig):
+    _discard(_by_name, job.name, job.id)
+    for label in job.labels or []:
+        _discard(_by_label, label, job.id)
+    if not job.repo_url:
+        return
+    repo = normalize_repo_url(job.repo_url)
+    _discard(_by_repo, repo, job.id)
+    _discard(_repo_wildcards, repo, job.id)
+    for pattern in job.branches or []:
+        _discard(_by_repo_branch, (repo, pattern), job.id)
+
+def _prewarm(jobs: List[JobConfig]):
+    # once per repo and process: the first build of a new job then finds a cloned workspace waiting
+    if not settings.WORKSPACE_PREWARM:
+        return
+    for url in {job.repo_url for job in jobs if job.repo_url}:
+        key = normalize_repo_url(url)
+        if key not in _prewarmed:
+            _prewarmed.add(key)
+            prewarm(url)
+
+def _resolve_pipeline(config: JobConfig):
+    # validates templated jobs up front; the queue re-expands pipeline_yaml so template updates apply per build
+    if config.pipeline_yaml:
+        try:
+            config.pipeline = parse_pipeline_yaml(config.pipeline_yaml, config.parameters)
+        except DSLParseError as e:
+            raise ValueError(str(e))
+
+def _sync():
+    """Reload jobs when another process changed them; one version read when nothing did."""
+    global _jobs_version, _next_seq
+    if get_store().jobs_version() == _jobs_version:
+        return
+    with _jobs_lock:
+        version, rows = get_store().jobs_all()
+        if version == _jobs_version:
+            return
+        fresh = {job_id: JobConfig.parse_raw(data) for job_id, data in rows}
+        for job_id in _jobs.keys() - fresh.keys():
+            _unschedule(job_id)
+        _jobs.clear()
+        for index in (_seq, _by_name, _by_label, _by_repo, _by_repo_branch, _repo_wildcards):
+            index.clear()
+        _next_seq = 0
+        for job in fresh.values():
+            _jobs[job.id] = job
+            _index(job)
+            if _leading:
+                if job.schedule_cron:
+                    _add_cron(job, _cron_trigger(job))
+                else:
+                    _unschedule(job.id)
+        _jobs_version = version
+        _prewarm(list(fresh.values()))
+    notify_changed()
+
+def _stored(version: int):
+    # our own write: skip the reload unless someone else wrote in between
+    global _jobs_version
+    if version == _jobs_version + 1:
+        _jobs_version = version
+    notify_changed()
+
+def _election_loop():
+    while True:
+        try:
+            _sync()
+            _check_leadership()
+        except Exception as e:
+            print("Scheduler election error:", e)
+        time.sleep(settings.SCHEDULER_LEADER_TTL / 3)
+
+def start_scheduler_election():
+    """With a shared store, keep this process's jobs fresh and compete for the scheduler lease in the background."""
+    global _election_thread
+    if settings.STATE_BACKEND == "memory" or (_election_thread and _election_thread.is_alive()):
+        return
+    _election_thread = threading.Thread(target=_election_loop, daemon=True)
+    _election_thread.start()
 
 def create_job(config: JobConfig) -> JobConfig:
     if not config.id:
         config.id = str(uuid.uuid4())
-    _jobs[config.id] = config
-    if config.schedule_cron:
-        # schedule it
-        trigger = CronTrigger.from_crontab(config.schedule_cron)
-        _scheduler.add_job(lambda job_id=config.id: enqueue_job(job_id, {}), id=config.id, trigger=trigger)
+    _resolve_pipeline(config)
+    # build the trigger first so an invalid cron expression leaves no half-created job behind
+    trigger = _cron_trigger(config) if config.schedule_cron else None
+    _sync()
+    with _jobs_lock:
+        _stored(get_store().job_put(config.id, config.json()))
+        old = _jobs.get(config.id)
+        if old:
+            _unindex(old)
+        _jobs[config.id] = config
+        _index(config)
+        _schedule(config, trigger)
+        _prewarm([config])
     return config
 
+class BatchError(ValueError):
+    """A batch was rejected as a whole; errors holds {"index", "error"} for every bad entry."""
+    def __init__(self, errors: List[Dict]):
+        super().__init__(f"{len(errors)} invalid entries")
+        self.errors = errors
+
+def create_jobs(configs: List[JobConfig]) -> List[JobConfig]:
+    """
+    Create or replace many jobs at once: everything is validated first, then the batch is stored in one
+    write (one version bump) and indexed/scheduled under a single lock hold. All or nothing.
+    """
+    triggers, errors = [], []
+    for i, config in enumerate(configs):
+        if not config.id:
+            config.id = str(uuid.uuid4())
+        try:
+            _resolve_pipeline(config)
+            triggers.append(_cron_trigger(config) if config.schedule_cron else None)
+        except ValueError as e:
+            errors.append({"index": i, "error": str(e)})
+    if errors:
+        raise BatchError(errors)
+    _sync()
+    with _jobs_lock:
+        _stored(get_store().job_put_many([(c.id, c.json()) for c in configs]))
+        for config in configs:
+            old = _jobs.get(config.id)
+            if old:
+                _unindex(old)
+            _jobs[config.id] = config
+            _index(config)
+        leading = _is_leader()
+        for config, trigger in zip(configs, triggers):
+            if trigger is None:
+                _unschedule(config.id)
+            elif leading:
+                _add_cron(config, trigger)
+        _prewarm(configs)
+    return configs
+
+def update_job(job_id: str, config: JobConfig) -> Optional[JobConfig]:
+    config.id = job_id
+    _resolve_pipeline(config)
+    trigger = _cron_trigger(config) if config.schedule_cron else None
+    _sync()
+    with _jobs_lock:
+        old = _jobs.get(job_id)
+        if not old:
+            return None
+        _stored(get_store().job_put(job_id, config.json()))
+        _unindex(old)
+        _jobs[job_id] = config
+        _index(config)
+        _schedule(config, trigger)
+        _prewarm([config])
+    return config
+
+def delete_job(job_id: str) -> bool:
+    _sync()
+    with _jobs_lock:
+        job = _jobs.pop(job_id, None)
+        if not job:
+            return False
+        _stored(get_store().job_delete(job_id))
+        _unindex(job)
+        _seq.pop(job_id, None)
+        _unschedule(job_id)
+    return True
+
+def jobs_version() -> int:
+    """Store version of the job set; changes on every create/update/delete in any process."""
+    return get_store().jobs_version()
+
 def get_job(job_id: str) -> Optional[JobConfig]:
+    _sync()
     return _jobs.get(job_id)
 
-def list_jobs() -> List[JobConfig]:
-    return list(_jobs.values())
+def query_jobs(offset: int = 0, limit: Optional[int] = None, name: Optional[str] = None,
+               label: Optional[str] = None, repo_url: Optional[str] = None) -> Tuple[int, List[JobConfig]]:
+    """Returns (total matches, requested page). Filters are answered from the indexes."""
+    _sync()
+    with _jobs_lock:
+        if name is None and label is None and repo_url is None:
+            jobs = list(_jobs.values())
+            end = None if limit is None else offset + limit
+            return len(jobs), jobs[offset:end]
+        candidates: Optional[Set[str]] = None
+        for index, key in ((_by_name, name), (_by_label, label),
+                           (_by_repo, normalize_repo_url(repo_url) if repo_url else None)):
+            if key is None:
+                continue
+            ids = index.get(key, set())
+            candidates = set(ids) if candidates is None else candidates & ids
+        ordered = sorted(candidates, key=_seq.__getitem__)
+        end = None if limit is None else offset + limit
+        return len(ordered), [_jobs[i] for i in ordered[offset:end]]
+
+def list_jobs(**filters) -> List[JobConfig]:
+    return query_jobs(**filters)[1]
+
+def find_jobs_for_ref(repo_url: str, ref: str) -> List[JobConfig]:
+    """Jobs watching repo_url whose branch filter accepts ref (webhook routing)."""
+    repo = normalize_repo_url(repo_url)
+    branch = _branch_name(ref)
+    _sync()
+    with _jobs_lock:
+        ids = set(_by_repo_branch.get((repo, branch), ()))
+        for job_id, rx in _repo_wildcards.get(repo, {}).items():
+            if rx is None or rx.match(branch):
+                ids.add(job_id)
+        return [_jobs[i] for i in sorted(ids, key=_seq.__getitem__)]
+
+def trigger_job(job_id: str, params: Dict[str,str] = None, context: Optional[Dict[str, str]] = None) -> str:
+    """Trigger immediate enqueue; returns the build id"""
+    return enqueue_job(job_id, params or {}, context)
+
+def trigger_jobs(requests: List[Tuple[str, Dict[str, str]]], context: Optional[Dict[str, str]] = None) -> List[str]:
+    """
+    Enqueue builds for many (job_id, params) in one store transaction; unknown jobs reject the whole batch.
+    context (the trigger's branch etc., see enqueue_job) applies to every build.
+    """
+    _sync()
+    errors = [{"index": i, "error": f"Job {job_id} not found"}
+              for i, (job_id, _) in enumerate(requests) if job_id not in _jobs]
+    if errors:
+        raise BatchError(errors)
+    return enqueue_jobs([(job_id, params or {}, context) for job_id, params in requests])
 
-def trigger_job(job_id: str, params: Dict[str,str] = None):
-    """Trigger immediate enqueue"""
-    enqueue_job(job_id, params or {})
+def export_jobs() -> Iterator[str]:
+    """Job configs as NDJSON lines; serialized lazily from a snapshot so a large export holds no lock."""
+    _sync()
+    with _jobs_lock:
+        jobs = list(_jobs.values())
+    for job in jobs:
+        yield job.json() + "\n"
@@ -0,0 +1,167 @@
+# backend/app/log_search.py
+# Full-text search over stage output with SQLite FTS5. Log writers feed blocks of whole lines into an
+# in-process queue; one indexer thread inserts them in batched transactions so stages never wait on SQLite
+# (when the indexer falls behind or its database is unavailable, blocks are dropped rather than queued forever).
+# log_blocks holds the metadata (job, build, step, byte offset) and shares its rowid with the log_fts row.
+import functools
+import os
+import queue as _queue_mod
+import sqlite3
+import threading
+import time
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Union
+from .config import settings
+from .metrics import LOG_INDEX_DROPPED
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS log_blocks (
+    id INTEGER PRIMARY KEY,
+    job_id TEXT, build_id TEXT, step TEXT, offset INTEGER, created_at REAL
+);
+CREATE INDEX IF NOT EXISTS log_blocks_build ON log_blocks(build_id);
+CREATE INDEX IF NOT EXISTS log_blocks_job_time ON log_blocks(job_id, created_at);
+CREATE VIRTUAL TABLE IF NOT EXISTS log_fts USING fts5(content);
+"""
+
+_pending: "_queue_mod.Queue" = _queue_mod.Queue(maxsize=10000)
+_writer_thread = None
+_writer_lock = threading.Lock()
+_local = threading.local()
+
+class LogSearchError(Exception):
+    pass
+
+@functools.lru_cache(maxsize=None)
+def fts5_available() -> bool:
+    try:
+        sqlite3.connect(":memory:").execute("CREATE VIRTUAL TABLE t USING fts5(content)")
+        return True
+    except sqlite3.OperationalError:
+        print("SQLite has no FTS5; log search is disabled")
+        return False
+
+def _connect() -> sqlite3.Connection:
+    os.makedirs(os.path.dirname(settings.LOG_SEARCH_DB) or ".", exist_ok=True)
+    conn = sqlite3.connect(settings.LOG_SEARCH_DB, timeout=30)
+    conn.execute("PRAGMA journal_mode=WAL")  # readers don't block the indexer and vice versa
+    conn.execute("PRAGMA synchronous=NORMAL")
+    conn.executescript(_SCHEMA)
+    return conn
+
+def _reader() -> sqlite3.Connection:
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        conn = _local.conn = _connect()
+    return conn
+
+def _writer_loop():
+    conn, backoff = None, 1.0
+    while True:
+        if conn is None:
+            try:
+                conn = _connect()
+                backoff = 1.0
+            except (sqlite3.Error, OSError) as e:
+                # blocks keep queueing (and are dropped once the queue is full) until the database opens
+                print("Log index unavailable, retrying in %.0fs:" % backoff, e)
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60.0)
+                continue
+        batch = [_pending.get()]
+        # drain whatever else is waiting so one commit covers many blocks
+        while len(batch) < 500:
+            try:
+                batch.append(_pending.get_nowait())
+            except _queue_mod.Empty:
+                break
+        try:
+            with conn:
+                for job_id, build_id, step, offset, created_at, text in batch:
+                    cur = conn.execute("INSERT INTO log_blocks (job_id, build_id, step, offset, created_at) "
+                                       "VALUES (?, ?, ?, ?, ?)", (job_id, build_id, step, offset, created_at))
+                    conn.execute("INSERT INTO log_fts (rowid, content) VALUES (?, ?)", (cur.lastrowid, text))
+        except sqlite3.Error as e:
+            print("Log indexing error:", e)
+
+def _ensure_writer():
+    global _writer_thread
+    with _writer_lock:
+        if _writer_thread is None or not _writer_thread.is_alive():
+            _writer_thread = threading.Thread(target=_writer_loop, daemon=True)
+            _writer_thread.start()
+
+class LogIndexer:
+    """Buffers a stage's output and emits blocks of complete lines (~LOG_SEARCH_BLOCK_SIZE bytes)."""
+    def __init__(self, job_id: str, build_id: str, step: str):
+        self.meta = (job_id, build_id, step)
+        self._buf = bytearray()
+        self._offset = 0  # raw log offset of _buf[0], so hits can link to a byte range in the log
+        _ensure_writer()
+
+    def feed(self, chunk: bytes):
+        self._buf += chunk
+        if len(self._buf) < settings.LOG_SEARCH_BLOCK_SIZE:
+            return
+        cut = self._buf.rfind(b"\n") + 1 or len(self._buf)
+        self._emit(bytes(self._buf[:cut]))
+        del self._buf[:cut]
+
+    def _emit(self, data: bytes):
+        try:
+            _pending.put_nowait((*self.meta, self._offset, time.time(), data.decode(errors="ignore")))
+        except _queue_mod.Full:
+            LOG_INDEX_DROPPED.inc()  # never stall the stage's output pump on indexing
+        self._offset += len(data)
+
+    def close(self):
+        if self._buf:
+            self._emit(bytes(self._buf))
+            self._buf.clear()
+
+def open_indexer(job_id: str, build_id: str, step: str) -> Optional[LogIndexer]:
+    return LogIndexer(job_id, build_id, step) if fts5_available() else None
+
+def _parse_since(since: Union[str, float, None]) -> Optional[float]:
+    if since is None or since == "":
+        return None
+    try:
+        return float(since)
+    except (TypeError, ValueError):
+        pass
+    try:
+        return datetime.fromisoformat(str(since)).timestamp()
+    except ValueError:
+        raise LogSearchError(f"'since' must be epoch seconds or an ISO date, got {since!r}")
+
+def search_logs(q: str, job_id: Optional[str] = None, since: Union[str, float, None] = None,
+                limit: int = 50) -> List[Dict[str, Any]]:
+    """FTS5 query syntax (words, "phrases", prefix*, AND/OR/NOT); best matches first."""
+    sql = ("SELECT b.job_id, b.build_id, b.step, b.offset, b.created_at, "
+           "snippet(log_fts, 0, '[', ']', '...', 16) FROM log_fts JOIN log_blocks b ON b.id = log_fts.rowid "
+           "WHERE log_fts MATCH ?")
+    args: List[Any] = [q]
+    if job_id:
+        sql += " AND b.job_id = ?"
+        args.append(job_id)
+    since_ts = _parse_since(since)
+    if since_ts is not None:
+        sql += " AND b.created_at >= ?"
+        args.append(since_ts)
+    if not fts5_available():
+        raise LogSearchError("Log search is unavailable: this SQLite build has no FTS5")
+    sql += " ORDER BY rank LIMIT ?"
+    args.append(limit)
+    try:
+        rows = _reader().execute(sql, args).fetchall()
+    except sqlite3.OperationalError as e:
+        raise LogSearchError(f"Invalid search query: {e}")
+    return [{"job_id": r[0], "build_id": r[1], "step": r[2], "offset": r[3], "indexed_at": r[4], "snippet": r[5]}
+            for r in rows]
+
+def delete_build_index(build_id: str):
+    if not fts5_available():
+        return
+    with _reader() as conn:
+        conn.execute("DELETE FROM log_fts WHERE rowid IN (SELECT id FROM log_blocks WHERE build_id = ?)", (build_id,))
+        conn.execute("DELETE FROM log_blocks WHERE build_id = ?", (build_id,))
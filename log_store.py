@@ -0,0 +1,221 @@
+# backend/app/log_store.py
+# Stage logs on disk as independently compressed chunks plus a seek index, so range and tail reads only
+# decompress the chunks they touch. Layout: LOG_PATH/<build_id>/<step>.log.gz (or .zst) and <step>.idx,
+# where each index record is (raw offset, raw length, compressed offset, compressed length).
+# gzip chunks are written as separate gzip members, so the .gz file is still readable with zcat.
+import bisect
+import os
+import re
+import shutil
+import struct
+import threading
+import time
+import zlib
+from typing import Dict, List, Optional, Tuple
+from .config import settings
+from .builds import snapshot_builds, delete_build, get_build
+from .log_search import open_indexer, delete_build_index
+
+try:
+    import zstandard
+except ImportError:  # optional; gzip is used when it isn't installed
+    zstandard = None
+
+_ENTRY = struct.Struct("<QIQI")
+_live: Dict[Tuple[str, str], "LogWriter"] = {}  # logs still being written, so readers see the unflushed tail
+_live_lock = threading.Lock()
+_retention_thread = None
+
+def _codec() -> str:
+    return "zstd" if settings.LOG_COMPRESSION == "zstd" and zstandard is not None else "gzip"
+
+def _safe(step: str) -> str:
+    return re.sub(r"[^A-Za-z0-9_.=,@#-]", "_", step)
+
+def _paths(build_id: str, step: str) -> Tuple[str, str, str]:
+    base = os.path.join(settings.LOG_PATH, _safe(build_id))
+    for ext, codec in ((".log.zst", "zstd"), (".log.gz", "gzip")):
+        data = os.path.join(base, _safe(step) + ext)
+        if os.path.exists(data):
+            return data, os.path.join(base, _safe(step) + ".idx"), codec
+    codec = _codec()
+    ext = ".log.zst" if codec == "zstd" else ".log.gz"
+    return os.path.join(base, _safe(step) + ext), os.path.join(base, _safe(step) + ".idx"), codec
+
+def _compress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdCompressor(level=3).compress(data)
+    c = zlib.compressobj(6, zlib.DEFLATED, 31)  # wbits=31: gzip container
+    return c.compress(data) + c.flush()
+
+def _decompress(data: bytes, codec: str) -> bytes:
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(data)
+    return zlib.decompress(data, 31)
+
+class LogWriter:
+    def __init__(self, build_id: str, step: str):
+        self.key = (build_id, step)
+        data_path, idx_path, self.codec = _paths(build_id, step)
+        os.makedirs(os.path.dirname(data_path), exist_ok=True)
+        self._data = open(data_path, "ab")
+        self._idx = open(idx_path, "ab")
+        self._buf = bytearray()
+        entries = _load_index(idx_path) if os.path.exists(idx_path) else []
+        self._raw_offset = entries[-1][0] + entries[-1][1] if entries else 0
+        self._lock = threading.Lock()
+        self.bytes_written = 0
+        build = get_build(build_id)
+        self._indexer = open_indexer(build["job_id"] if build else "", build_id, step) \
+            if settings.LOG_SEARCH_ENABLED else None
+        with _live_lock:
+            _live[self.key] = self
+
+    def write(self, chunk: bytes):
+        with self._lock:
+            self._buf += chunk
+            self.bytes_written += len(chunk)
+            if self._indexer:
+                self._indexer.feed(chunk)
+            while len(self._buf) >= settings.LOG_CHUNK_SIZE:
+                self._flush_chunk(bytes(self._buf[:settings.LOG_CHUNK_SIZE]))
+                del self._buf[:settings.LOG_CHUNK_SIZE]
+
+    def _flush_chunk(self, raw: bytes):
+        comp = _compress(raw, self.codec)
+        comp_offset = self._data.tell()
+        self._data.write(comp)
+        self._data.flush()
+        # the index record goes last, so a reader never sees an entry pointing at unwritten data
+        self._idx.write(_ENTRY.pack(self._raw_offset, len(raw), comp_offset, len(comp)))
+        self._idx.flush()
+        self._raw_offset += len(raw)
+
+    def pending(self) -> Tuple[int, bytes]:
+        """(raw offset, bytes) of data not yet compressed."""
+        with self._lock:
+            return self._raw_offset, bytes(self._buf)
+
+    def close(self):
+        with self._lock:
+            if self._buf:
+                self._flush_chunk(bytes(self._buf))
+                self._buf.clear()
+            self._data.close()
+            self._idx.close()
+            if self._indexer:
+                self._indexer.close()
+        with _live_lock:
+            _live.pop(self.key, None)
+
+def open_log(build_id: str, step: str) -> LogWriter:
+    return LogWriter(build_id, step)
+
+def _load_index(idx_path: str) -> List[Tuple[int, int, int, int]]:
+    with open(idx_path, "rb") as f:
+        raw = f.read()
+    usable = len(raw) - len(raw) % _ENTRY.size
+    return [_ENTRY.unpack_from(raw, i) for i in range(0, usable, _ENTRY.size)]
+
+def log_size(build_id: str, step: str) -> Optional[int]:
+    data_path, idx_path, _ = _paths(build_id, step)
+    writer = _live.get((build_id, step))
+    if writer:
+        offset, buf = writer.pending()
+        return offset + len(buf)
+    if not os.path.exists(idx_path):
+        return None
+    entries = _load_index(idx_path)
+    return entries[-1][0] + entries[-1][1] if entries else 0
+
+def read_range(build_id: str, step: str, start: int = 0, end: Optional[int] = None) -> Optional[bytes]:
+    """Bytes [start, end) of the uncompressed log; None when the log doesn't exist."""
+    data_path, idx_path, codec = _paths(build_id, step)
+    if not os.path.exists(idx_path):
+        return None
+    while True:
+        entries = _load_index(idx_path)
+        indexed = entries[-1][0] + entries[-1][1] if entries else 0
+        writer = _live.get((build_id, step))
+        pending_offset, pending = writer.pending() if writer else (indexed, b"")
+        # a chunk flushed between the two reads would otherwise be missing; just look again
+        if pending_offset == indexed:
+            break
+    total = indexed + len(pending)
+    end = total if end is None else min(end, total)
+    if start >= end:
+        return b""
+    out = bytearray()
+    offsets = [e[0] for e in entries]
+    first = max(0, bisect.bisect_right(offsets, start) - 1)
+    with open(data_path, "rb") as f:
+        for raw_off, raw_len, comp_off, comp_len in entries[first:]:
+            if raw_off >= end:
+                break
+            f.seek(comp_off)
+            chunk = _decompress(f.read(comp_len), codec)
+            out += chunk[max(0, start - raw_off):end - raw_off]
+    if pending and end > pending_offset:
+        out += pending[max(0, start - pending_offset):end - pending_offset]
+    return bytes(out)
+
+def tail(build_id: str, step: str, nbytes: int = 64 * 1024) -> Optional[bytes]:
+    size = log_size(build_id, step)
+    if size is None:
+        return None
+    return read_range(build_id, step, max(0, size - nbytes), size)
+
+def list_logs(build_id: str) -> List[str]:
+    base = os.path.join(settings.LOG_PATH, _safe(build_id))
+    if not os.path.isdir(base):
+        return []
+    return sorted(f[:-4] for f in os.listdir(base) if f.endswith(".idx"))
+
+def delete_logs(build_id: str):
+    shutil.rmtree(os.path.join(settings.LOG_PATH, _safe(build_id)), ignore_errors=True)
+
+def retention_victims(now: Optional[float] = None) -> List[str]:
+    """
+    Finished builds past retention: beyond the newest LOG_RETENTION_BUILDS_PER_JOB of their job and
+    older than LOG_RETENTION_SUCCESS_DAYS (successful) or LOG_RETENTION_FAILURE_DAYS (everything else).
+    """
+    now = now or time.time()
+    per_job: Dict[str, List[Tuple[str, str, Optional[float], float]]] = {}
+    for build_id, job_id, status, finished_at, created_at in snapshot_builds():
+        per_job.setdefault(job_id, []).append((build_id, status, finished_at, created_at))
+    victims = []
+    for builds in per_job.values():
+        builds.sort(key=lambda b: b[3], reverse=True)
+        for build_id, status, finished_at, _ in builds[settings.LOG_RETENTION_BUILDS_PER_JOB:]:
+            if finished_at is None:
+                continue
+            days = settings.LOG_RETENTION_SUCCESS_DAYS if status == "SUCCESS" else settings.LOG_RETENTION_FAILURE_DAYS
+            if now - finished_at > days * 86400:
+                victims.append(build_id)
+    return victims
+
+def apply_retention(batch: int = 100) -> int:
+    """Delete up to `batch` expired builds; the build store is only locked per record, never for the sweep."""
+    victims = retention_victims()[:batch]
+    for build_id in victims:
+        delete_logs(build_id)
+        delete_build_index(build_id)
+        delete_build(build_id)
+    return len(victims)
+
+def _retention_loop():
+    while True:
+        try:
+            # keep going in small batches while there is a backlog, then idle until the next interval
+            while apply_retention(100) >= 100:
+                time.sleep(0.1)
+        except Exception as e:
+            print("Log retention error:", e)
+        time.sleep(settings.LOG_RETENTION_INTERVAL)
+
+def start_retention():
+    global _retention_thread
+    if _retention_thread and _retention_thread.is_alive():
+        return
+    _retention_thread = threading.Thread(target=_retention_loop, daemon=True)
+    _retention_thread.start()
@@ -1,49 +1,363 @@
 # backend/app/main.py
-from fastapi import FastAPI, HTTPException, Request, BackgroundTasks
+from fastapi import FastAPI, HTTPException, Request, BackgroundTasks, Response, Query
+from fastapi.responses import StreamingResponse
+from typing import Any, Dict, List, Optional, Tuple
 from .config import settings
 from .pipeline.dsl_parser import parse_pipeline_yaml, DSLParseError
 from .models import JobConfig, PipelineSpec, TriggerEvent
-from .job_manager import create_job, list_jobs, trigger_job, get_job
-from .queue import queue_status, start_worker
-from .vcs import ensure_repo
+from .job_manager import (create_job, create_jobs, update_job, delete_job, list_jobs, query_jobs, trigger_job,
+                          trigger_jobs, export_jobs, get_job, find_jobs_for_ref, shutdown_scheduler,
+                          start_scheduler_election, jobs_version, BatchError)
+from .queue import queue_status, queue_version, start_worker
+from .builds import get_build, list_builds
+from .metrics import render_latest, CONTENT_TYPE_LATEST, RESPONSE_CACHE
+from .tracing import get_trace
+from .log_store import list_logs, read_range, log_size, start_retention
+from .log_search import search_logs, LogSearchError
+from .pipeline.failure_analyzer import top_causes
+from .artifacts import store_stream, get_artifact, list_artifacts, read_blob, ArtifactPathError
+from .offload import run_blocking, watch_event_loop, shutdown as shutdown_offload
+from .workspace import workspace_status
+from .response_cache import snapshot, wait_until_changed, etag_for
+from .secret_store import set_secret, delete_secret, list_secrets, SecretError
 from .pipeline.multibranch import get_pull_request_info
+import asyncio
+import json
 import os
+import re
 
-app = FastAPI(title=settings.APP_NAME)
+app = FastAPI()  # title is set at startup: reading settings here would build them at import
+# Endpoints stay async; anything that can take more than a few ms (YAML parsing, scheduler calls,
+# serializing many jobs) goes through run_blocking so other requests keep being served.
 
+# Startup only starts threads: the cron scheduler, git, YAML and notification clients load on first use,
+# so a fresh replica answers requests as soon as the imports below are done.
 @app.on_event("startup")
-def startup():
+async def startup():
+    app.title = settings.APP_NAME  # read by the OpenAPI schema, which is only built on first request
     os.makedirs(settings.REPO_BASE_PATH, exist_ok=True)
     start_worker()
+    start_retention()
+    start_scheduler_election()
+    app.state.loop_watchdog = asyncio.create_task(watch_event_loop())
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.loop_watchdog.cancel()
+    shutdown_scheduler()
+    shutdown_offload()
 
 @app.post("/pipelines/parse")
-async def parse_pipeline(yaml_text: str):
+async def parse_pipeline(yaml_text: str, params: Optional[Dict[str, str]] = None):
     try:
-        pipeline = parse_pipeline_yaml(yaml_text)
-        return {"ok": True, "pipeline": pipeline.dict()}
+        pipeline = await run_blocking(lambda: parse_pipeline_yaml(yaml_text, params).dict())
+        return {"ok": True, "pipeline": pipeline}
     except DSLParseError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @app.post("/jobs")
 async def create_job_endpoint(cfg: JobConfig):
-    job = create_job(cfg)
+    try:
+        job = await run_blocking(create_job, cfg)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
     return {"ok": True, "job": job}
 
+def _batch_records(body: bytes, content_type: str) -> List[Any]:
+    """A JSON array, or NDJSON (one object per line) when sent as application/x-ndjson."""
+    if "ndjson" in content_type:
+        records = []
+        for n, line in enumerate(body.splitlines(), 1):
+            if line.strip():
+                try:
+                    records.append(json.loads(line))
+                except ValueError as e:
+                    raise BatchError([{"line": n, "error": str(e)}])
+        return records
+    try:
+        records = json.loads(body)
+    except ValueError as e:
+        raise BatchError([{"index": None, "error": str(e)}])
+    if not isinstance(records, list):
+        raise BatchError([{"index": None, "error": "Expected a JSON array"}])
+    return records
+
+def _parse_configs(body: bytes, content_type: str) -> List[JobConfig]:
+    configs, errors = [], []
+    for i, record in enumerate(_batch_records(body, content_type)):
+        try:
+            configs.append(JobConfig.parse_obj(record))
+        except ValueError as e:
+            errors.append({"index": i, "error": str(e)})
+    if errors:
+        raise BatchError(errors)
+    return configs
+
+@app.post("/jobs:batch")
+async def create_jobs_endpoint(request: Request):
+    # import: the whole batch is validated, then stored in one write; any bad entry rejects all of it
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+    try:
+        jobs = await run_blocking(lambda: create_jobs(_parse_configs(body, content_type)))
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    return {"ok": True, "created": len(jobs), "job_ids": [j.id for j in jobs]}
+
+@app.get("/jobs:export")
+async def export_jobs_endpoint():
+    # a sync iterator: Starlette serializes each job in the threadpool as the response streams
+    return StreamingResponse(export_jobs(), media_type="application/x-ndjson")
+
+@app.post("/jobs:trigger-batch")
+async def trigger_jobs_endpoint(request: Request):
+    # entries are {"job_id": ..., "params": {...}}; all builds are enqueued in one transaction
+    body = await request.body()
+    content_type = request.headers.get("content-type", "")
+
+    def run():
+        requests, errors = [], []
+        for i, record in enumerate(_batch_records(body, content_type)):
+            if not isinstance(record, dict) or not isinstance(record.get("job_id"), str) \
+                    or not isinstance(record.get("params") or {}, dict):
+                errors.append({"index": i, "error": "Expected {\"job_id\": str, \"params\": object}"})
+                continue
+            requests.append((record["job_id"], {k: str(v) for k, v in (record.get("params") or {}).items()}))
+        if errors:
+            raise BatchError(errors)
+        return trigger_jobs(requests)
+    try:
+        build_ids = await run_blocking(run)
+    except BatchError as e:
+        raise HTTPException(status_code=400, detail={"message": str(e), "errors": e.errors})
+    return {"ok": True, "build_ids": build_ids}
+
+@app.put("/jobs/{job_id}")
+async def update_job_endpoint(job_id: str, cfg: JobConfig):
+    try:
+        job = await run_blocking(update_job, job_id, cfg)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not job:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"ok": True, "job": job}
+
+@app.delete("/jobs/{job_id}")
+async def delete_job_endpoint(job_id: str):
+    if not await run_blocking(delete_job, job_id):
+        raise HTTPException(status_code=404, detail="Job not found")
+    return {"ok": True}
+
+def _json_bytes(content) -> bytes:
+    # the same encoding JSONResponse uses
+    return json.dumps(content, ensure_ascii=False, allow_nan=False, separators=(",", ":")).encode()
+
+async def _polled(request: Request, key: str, current, render, wait: float) -> Response:
+    """
+    Serve a listing from its versioned snapshot: 304 when If-None-Match still matches, the cached (optionally
+    gzip'd) bytes otherwise. wait > 0 turns a matching conditional request into a long poll for the next change.
+    """
+    version = await run_blocking(current)  # a store query on SQLite
+    client_tags = {t.strip() for t in request.headers.get("if-none-match", "").split(",")}
+    if wait > 0 and etag_for(key, version) in client_tags:
+        version = await wait_until_changed(current, version, wait)
+    headers = {"ETag": etag_for(key, version), "Cache-Control": "no-cache", "Vary": "Accept-Encoding"}
+    if headers["ETag"] in client_tags:
+        RESPONSE_CACHE.labels("not_modified").inc()
+        return Response(status_code=304, headers=headers)
+    gzip_ok = "gzip" in request.headers.get("accept-encoding", "")
+
+    def build():
+        snap = snapshot(key, version, render)
+        if gzip_ok and len(snap.body) >= settings.RESPONSE_GZIP_MIN_BYTES:
+            return snap.gzipped(), True
+        return snap.body, False
+    body, gzipped = await run_blocking(build)
+    if gzipped:
+        headers["Content-Encoding"] = "gzip"
+    return Response(body, media_type="application/json", headers=headers)
+
 @app.get("/jobs")
-async def list_jobs_endpoint():
-    return {"jobs": [j.dict() for j in list_jobs()]}
+async def list_jobs_endpoint(request: Request, offset: int = Query(0, ge=0), limit: Optional[int] = Query(None, ge=1),
+                             name: Optional[str] = None, label: Optional[str] = None,
+                             repo_url: Optional[str] = None, fields: Optional[str] = None,
+                             wait_for_change: float = 0):
+    # fields=id,name serializes only the requested attributes instead of whole pipelines
+    include = set(f.strip() for f in fields.split(",") if f.strip()) if fields else None
+
+    def render():
+        total, jobs = query_jobs(offset=offset, limit=limit, name=name, label=label, repo_url=repo_url)
+        return _json_bytes({"total": total, "offset": offset, "limit": limit,
+                            "jobs": [j.dict(include=include) for j in jobs]})
+    key = f"jobs?{offset}&{limit}&{name}&{label}&{repo_url}&{','.join(sorted(include or ()))}"
+    return await _polled(request, key, jobs_version, render, wait_for_change)
 
 @app.post("/jobs/{job_id}/trigger")
 async def trigger_job_endpoint(job_id: str, params: dict = {}):
-    job = get_job(job_id)
-    if not job:
+    # store reads/writes (and a job reload after another process's change) stay off the loop
+    if not await run_blocking(get_job, job_id):
         raise HTTPException(status_code=404, detail="Job not found")
-    trigger_job(job_id, params)
-    return {"ok": True}
+    build_id = await run_blocking(trigger_job, job_id, params)
+    return {"ok": True, "build_id": build_id}
+
+@app.get("/builds")
+async def list_builds_endpoint(job_id: Optional[str] = None, limit: int = 50):
+    return {"builds": await run_blocking(list_builds, job_id, limit)}
+
+@app.get("/builds/{build_id}")
+async def get_build_endpoint(build_id: str):
+    build = await run_blocking(get_build, build_id)
+    if not build:
+        raise HTTPException(status_code=404, detail="Build not found")
+    return build
+
+@app.get("/builds/{build_id}/timeline")
+async def build_timeline_endpoint(build_id: str, format: str = "json"):
+    # format=chrome returns Trace Event JSON loadable in chrome://tracing or Perfetto
+    trace = get_trace(build_id)
+    if not trace:
+        raise HTTPException(status_code=404, detail="No timeline recorded for this build")
+    if format == "chrome":
+        return trace.to_chrome_trace()
+    return trace.to_json()
 
 @app.get("/queue")
-async def queue_status_endpoint():
-    return queue_status()
+async def queue_status_endpoint(request: Request, wait_for_change: float = 0):
+    return await _polled(request, "queue", queue_version, lambda: _json_bytes(queue_status()), wait_for_change)
+
+@app.get("/builds/{build_id}/logs")
+async def build_logs_endpoint(build_id: str):
+    return {"logs": await run_blocking(list_logs, build_id)}
+
+_BYTE_RANGE = re.compile(r"^bytes=\s*(\d*)\s*-\s*(\d*)\s*$")
+
+def _byte_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    [start, end) of the first range in a "Range: bytes=..." header, clamped to size; None without a byte range.
+    Malformed or unsatisfiable specs get 416 rather than a 500 from int().
+    """
+    if not header.startswith("bytes="):
+        return None
+    m = _BYTE_RANGE.match(header.split(",")[0])
+    if m and m.group(1):
+        start, end = int(m.group(1)), min(int(m.group(2)) + 1, size) if m.group(2) else size
+    elif m and m.group(2):
+        start, end = max(0, size - int(m.group(2))), size
+    else:
+        start = end = size
+    if start >= size or start >= end:
+        raise HTTPException(status_code=416, detail="Range not satisfiable",
+                            headers={"Content-Range": f"bytes */{size}"})
+    return start, end
+
+@app.get("/builds/{build_id}/logs/{step}")
+async def build_log_endpoint(build_id: str, step: str, request: Request, start: int = 0,
+                             end: Optional[int] = None, tail: Optional[int] = None):
+    # byte ranges come from ?start=&end=, ?tail=N or a "Range: bytes=a-b" header; only touched chunks are inflated
+    size = await run_blocking(log_size, build_id, step)
+    if size is None:
+        raise HTTPException(status_code=404, detail="Log not found")
+    byte_range = _byte_range(request.headers.get("range", ""), size)
+    partial = byte_range is not None
+    if partial:
+        start, end = byte_range
+    elif tail is not None:
+        start = max(0, size - tail)
+    data = await run_blocking(read_range, build_id, step, start, end)
+    if not partial:
+        return Response(content=data, media_type="text/plain")
+    return Response(content=data, status_code=206, media_type="text/plain",
+                    headers={"Content-Range": f"bytes {start}-{start + len(data) - 1}/{size}",
+                             "Accept-Ranges": "bytes"})
+
+@app.get("/builds/{build_id}/artifacts")
+async def list_artifacts_endpoint(build_id: str):
+    return {"artifacts": await run_blocking(list_artifacts, build_id)}
+
+@app.put("/builds/{build_id}/artifacts/{path:path}")
+async def upload_artifact_endpoint(build_id: str, path: str, request: Request):
+    # raw request body, streamed to disk chunk by chunk; identical content is stored once
+    if not await run_blocking(get_build, build_id):
+        raise HTTPException(status_code=404, detail="Build not found")
+    try:
+        entry = await store_stream(build_id, path, request.stream())
+    except ArtifactPathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True, "artifact": entry}
+
+@app.get("/builds/{build_id}/artifacts/{path:path}")
+async def download_artifact_endpoint(build_id: str, path: str, request: Request):
+    try:
+        entry = await run_blocking(get_artifact, build_id, path)
+    except ArtifactPathError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not entry:
+        raise HTTPException(status_code=404, detail="Artifact not found")
+    etag = f'"{entry["sha256"]}"'
+    headers = {"ETag": etag, "Accept-Ranges": "bytes", "Cache-Control": "private, max-age=31536000, immutable"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    size = entry["size"]
+    # a Range is honoured unless If-Range names a different version
+    byte_range = _byte_range(request.headers.get("range", ""), size) \
+        if request.headers.get("if-range", etag) == etag else None
+    if byte_range:
+        start, end = byte_range
+        headers.update({"Content-Range": f"bytes {start}-{end - 1}/{size}", "Content-Length": str(end - start)})
+        return StreamingResponse(read_blob(entry["blob"], start, end), status_code=206,
+                                 media_type="application/octet-stream", headers=headers)
+    headers["Content-Length"] = str(size)
+    return StreamingResponse(read_blob(entry["blob"]), media_type="application/octet-stream", headers=headers)
+
+@app.get("/search/logs")
+async def search_logs_endpoint(q: str, job_id: Optional[str] = None, since: Optional[str] = None, limit: int = 50):
+    # each hit carries build/step/offset, so the UI can open /builds/{id}/logs/{step}?start=offset
+    try:
+        hits = await run_blocking(search_logs, q, job_id, since, limit)
+    except LogSearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"hits": hits}
+
+@app.get("/failures/causes")
+async def failure_causes_endpoint(limit: int = 20, category: Optional[str] = None):
+    return {"causes": await run_blocking(top_causes, limit, category)}
+
+@app.get("/workspaces")
+async def workspaces_endpoint():
+    return await run_blocking(workspace_status)
+
+def _require_token(request: Request):
+    # same shared token as the webhook; values are write-only, listing returns names only
+    if request.headers.get("X-Webhook-Token") != settings.SECRET_TOKEN:
+        raise HTTPException(status_code=403, detail="Invalid token")
+
+@app.get("/secrets")
+async def list_secrets_endpoint(request: Request):
+    _require_token(request)
+    return {"secrets": await run_blocking(list_secrets)}
+
+@app.put("/secrets/{name}")
+async def put_secret_endpoint(name: str, request: Request):
+    _require_token(request)
+    body = await request.json()
+    try:
+        await run_blocking(set_secret, name, str(body["value"]))
+    except (KeyError, TypeError):
+        raise HTTPException(status_code=400, detail="Body must be {\"value\": ...}")
+    except SecretError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"ok": True}
+
+@app.delete("/secrets/{name}")
+async def delete_secret_endpoint(name: str, request: Request):
+    _require_token(request)
+    if not await run_blocking(delete_secret, name):
+        raise HTTPException(status_code=404, detail="Secret not found")
+    return {"ok": True}
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    return Response(content=await run_blocking(render_latest), media_type=CONTENT_TYPE_LATEST)
 
 @app.post("/webhook")
 async def webhook_listener(request: Request):
@@ -54,7 +368,17 @@ async def webhook_listener(request: Request):
         raise HTTPException(status_code=403, detail="Invalid token")
     # parse PR info
     pr_info = get_pull_request_info(data)
-    # enqueue a PR-based job — for demo we simply print
-    return {"ok": True, "pr": pr_info}
+    # route to the jobs watching this repo/branch (push events carry "ref", PR events the head ref)
+    repo_url = (data.get("repository") or {}).get("clone_url") or pr_info.get("clone_url")
+    ref = pr_info.get("head_ref") or data.get("ref")
+    context = {"branch": ref[len("refs/heads/"):] if ref and ref.startswith("refs/heads/") else ref,
+               "base_branch": pr_info.get("base_ref"), "before": data.get("before")}
+
+    def route():
+        # one off-loop call: job lookup, then every matching build enqueued in one store transaction
+        jobs = find_jobs_for_ref(repo_url, ref) if repo_url and ref else []
+        return jobs, trigger_jobs([(job.id, {}) for job in jobs], context) if jobs else []
+    jobs, builds = await run_blocking(route)
+    return {"ok": True, "pr": pr_info, "triggered": [j.id for j in jobs], "builds": builds}
 
 #commit change
\ No newline at end of file
@@ -1,17 +1,205 @@
 # backend/app/maven_runner.py
 # Executes Maven builds and parses pom.xml dependencies (simple).
+# run_maven streams output as it arrives and, when mvnd is installed, runs on warm Maven daemons. Daemons are
+# pooled per (agent, JDK) through separate mvnd daemon storage dirs and stopped after MAVEN_DAEMON_IDLE_TIMEOUT.
 
+import asyncio
+import re
 import subprocess
+import threading
+import time
 import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
 import os
-from typing import List, Dict
+from typing import Awaitable, Callable, List, Dict, Optional, Set, Tuple
+from .config import settings
+from .pipeline.toolchains import base_env, select_jdk, which
+
+_REACTOR_LINE = re.compile(r"^\[INFO\] (?P<module>.+?) \.+ ?(?P<status>SUCCESS|FAILURE|SKIPPED)"
+                           r"(?: \[\s*(?P<time>[\d:.]+) (?P<unit>s|min|h)\])?")
+_TOTAL_TIME = re.compile(r"^\[INFO\] Total time:\s+(?P<time>[\d:.]+) (?P<unit>s|min|h)")
+
+def _seconds(value: str, unit: str) -> float:
+    # "1.234 s", "01:02 min" (mm:ss), "01:02 h" (hh:mm)
+    if unit == "s":
+        return float(value)
+    major, _, minor = value.partition(":")
+    return int(major) * (3600 if unit == "h" else 60) + float(minor or 0) * (60 if unit == "h" else 1)
+
+class ReactorSummary:
+    """Incremental parser for Maven's reactor summary: per-module status and duration, plus total time."""
+    def __init__(self):
+        self.modules: List[Dict] = []
+        self.total_seconds: Optional[float] = None
+        self._in_summary = False
+        self._partial = b""
+
+    def feed(self, chunk: bytes):
+        lines = (self._partial + chunk).split(b"\n")
+        self._partial = lines.pop()
+        for line in lines:
+            self._line(line.decode(errors="ignore").rstrip("\r"))
+
+    def close(self):
+        if self._partial:
+            self._line(self._partial.decode(errors="ignore"))
+            self._partial = b""
+
+    def _line(self, line: str):
+        if "Reactor Summary" in line:
+            self._in_summary = True
+            self.modules = []
+            return
+        m = _TOTAL_TIME.match(line)
+        if m:
+            self.total_seconds = _seconds(m.group("time"), m.group("unit"))
+            self._in_summary = False
+            return
+        if self._in_summary:
+            m = _REACTOR_LINE.match(line)
+            if m:
+                self.modules.append({"module": m.group("module"), "status": m.group("status"),
+                                     "seconds": _seconds(m.group("time"), m.group("unit")) if m.group("time") else None})
+
+# daemon pool bookkeeping: storage dir -> active runs / last use
+_active: Dict[str, int] = {}
+_last_used: Dict[str, float] = {}
+_stopping: Set[str] = set()  # pools whose daemons are being stopped; not handed out until that finishes
+_pool_lock = threading.Lock()
+_reaper = None
+
+def _daemon_storage(agent: str, jdk: Optional[str]) -> str:
+    return os.path.join(settings.MAVEN_DAEMON_PATH, f"{agent}-jdk{jdk or 'default'}")
+
+def _checkout(storage: str) -> bool:
+    """Claim a pool for one run; False while its daemons are being stopped (the caller retries shortly)."""
+    global _reaper
+    with _pool_lock:
+        if storage in _stopping:
+            return False
+        _active[storage] = _active.get(storage, 0) + 1
+        _last_used[storage] = time.time()
+        if _reaper is None or not _reaper.is_alive():
+            _reaper = threading.Thread(target=_reap_loop, daemon=True)
+            _reaper.start()
+    return True
+
+def _checkin(storage: str):
+    with _pool_lock:
+        _active[storage] -= 1
+        _last_used[storage] = time.time()
+
+def _reap_loop():
+    while True:
+        time.sleep(min(60, settings.MAVEN_DAEMON_IDLE_TIMEOUT))
+        now = time.time()
+        with _pool_lock:
+            idle = [s for s, t in _last_used.items()
+                    if not _active.get(s) and now - t > settings.MAVEN_DAEMON_IDLE_TIMEOUT]
+            for s in idle:
+                del _last_used[s]
+            # chosen and marked under one lock hold, so no build can check out a pool between the two
+            _stopping.update(idle)
+        for storage in idle:
+            try:
+                stop_daemons(storage)
+            finally:
+                with _pool_lock:
+                    _stopping.discard(storage)
+
+def stop_daemons(storage: Optional[str] = None):
+    """Stop the warm daemons of one pool (or of every pool this process started)."""
+    mvnd = which("mvnd", base_env().get("PATH", os.defpath))
+    if not mvnd:
+        return
+    with _pool_lock:
+        targets = [storage] if storage else list(_last_used)
+    for s in targets:
+        try:
+            subprocess.run([mvnd, "--stop", f"-Dmvnd.daemonStorage={s}"], capture_output=True, timeout=60)
+        except (OSError, subprocess.TimeoutExpired) as e:
+            print("mvnd --stop failed:", e)
+
+def _command(mvn_args: List[str], env: Dict[str, str], use_daemon: bool, agent: str,
+             jdk: Optional[str]) -> Tuple[List[str], Optional[str]]:
+    path = env.get("PATH", os.defpath)
+    mvnd = which("mvnd", path) if use_daemon else None
+    if mvnd:
+        storage = _daemon_storage(agent, jdk)
+        return [mvnd, "-B", f"-Dmvnd.daemonStorage={storage}",
+                f"-Dmvnd.idleTimeout={settings.MAVEN_DAEMON_IDLE_TIMEOUT}s", *mvn_args], storage
+    return [which("mvn", path) or "mvn", *mvn_args], None
+
+async def run_maven(repo_path: str, mvn_args: List[str] = None, jdk: Optional[str] = None, agent: str = "local",
+                    env: Optional[Dict[str, str]] = None, use_daemon: Optional[bool] = None,
+                    on_output: Optional[Callable[[bytes], Optional[Awaitable]]] = None,
+                    timeout: Optional[float] = None) -> Dict:
+    """
+    Run Maven without blocking the event loop. Output goes to on_output chunk by chunk (only a bounded tail
+    is kept in the result); the reactor summary is parsed on the fly into per-module timings.
+    """
+    run_env = base_env()
+    run_env.update(env or {})
+    if jdk:
+        run_env["JDK"] = jdk
+    select_jdk(run_env)
+    use_daemon = settings.MAVEN_USE_DAEMON if use_daemon is None else use_daemon
+    argv, storage = _command(list(mvn_args or []), run_env, use_daemon, agent, jdk)
+    summary = ReactorSummary()
+    tail = bytearray()
+    start = time.time()
+    if storage:
+        while not _checkout(storage):
+            await asyncio.sleep(0.2)
+    try:
+        proc = await asyncio.create_subprocess_exec(*argv, cwd=repo_path, env=run_env,
+                                                    stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+
+        async def pump():
+            while True:
+                chunk = await proc.stdout.read(65536)
+                if not chunk:
+                    break
+                summary.feed(chunk)
+                tail.extend(chunk)
+                if len(tail) > 2 * settings.STAGE_OUTPUT_TAIL:
+                    del tail[:-settings.STAGE_OUTPUT_TAIL]
+                if on_output:
+                    pending = on_output(chunk)
+                    if pending is not None:
+                        await pending
+            await proc.wait()
+        try:
+            await asyncio.wait_for(pump(), timeout=timeout)
+            rc = proc.returncode
+        except asyncio.TimeoutError:
+            proc.kill()
+            await proc.wait()
+            rc = None
+    finally:
+        if storage:
+            _checkin(storage)
+    summary.close()
+    return {"returncode": rc, "output": bytes(tail[-settings.STAGE_OUTPUT_TAIL:]).decode(errors="ignore"),
+            "modules": summary.modules, "total_seconds": summary.total_seconds,
+            "duration": time.time() - start, "daemon": storage is not None}
 
 def run_maven_build(repo_path: str, mvn_args: List[str] = None) -> Dict:
-    args = ["mvn"]
-    if mvn_args:
-        args.extend(mvn_args)
-    proc = subprocess.run(args, cwd=repo_path, capture_output=True, text=True)
-    return {"returncode": proc.returncode, "stdout": proc.stdout, "stderr": proc.stderr}
+    """
+    Blocking wrapper kept for existing callers; stdout holds the full (merged) output. Works from any thread:
+    inside a running event loop (a stage, an async endpoint) the run gets a private loop on a helper thread.
+    """
+    out = bytearray()
+    run = lambda: asyncio.run(run_maven(repo_path, mvn_args, on_output=out.extend))
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        result = run()
+    else:
+        with ThreadPoolExecutor(max_workers=1) as helper:
+            result = helper.submit(run).result()
+    return {"returncode": result["returncode"], "stdout": out.decode(errors="ignore"), "stderr": "",
+            "modules": result["modules"]}
 
 # runner boy
 
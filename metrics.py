@@ -0,0 +1,198 @@
+# backend/app/metrics.py
+# Minimal Prometheus-compatible metrics. Every metric used by the server is declared here up front;
+# increments land in per-thread shards (no lock on the hot path) and only a scrape sums the shards.
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+_registry: List["_Metric"] = []
+
+class _Shards:
+    """Per-thread value arrays: each thread only ever writes its own array, readers add them up."""
+    def __init__(self, size: int):
+        self._size = size
+        self._local = threading.local()
+        self._all: List[List[float]] = []
+        self._lock = threading.Lock()
+
+    def mine(self) -> List[float]:
+        values = getattr(self._local, "values", None)
+        if values is None:
+            values = [0.0] * self._size
+            self._local.values = values
+            with self._lock:
+                self._all.append(values)
+        return values
+
+    def totals(self) -> List[float]:
+        with self._lock:
+            shards = list(self._all)
+        return [sum(col) for col in zip(*shards)] if shards else [0.0] * self._size
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), prealloc: Sequence[Sequence[str]] = ()):
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        for values in prealloc:
+            self.labels(*values)
+        if not self.labelnames:
+            self._default = self.labels()
+        _registry.append(self)
+
+    def labels(self, *values: str):
+        child = self._children.get(values)
+        if child is None:
+            if len(values) != len(self.labelnames):
+                raise ValueError(f"{self.name} expects labels {self.labelnames}")
+            with self._lock:
+                child = self._children.setdefault(values, self._new_child())
+        return child
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def _label_str(self, values: Tuple[str, ...], extra: str = "") -> str:
+        pairs = [f'{k}="{v}"' for k, v in zip(self.labelnames, values)]
+        if extra:
+            pairs.append(extra)
+        return "{" + ",".join(pairs) + "}" if pairs else ""
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        for values, child in list(self._children.items()):
+            lines.extend(self._render_child(values, child))
+        return lines
+
+class _CounterChild:
+    def __init__(self):
+        self._shards = _Shards(1)
+
+    def inc(self, amount: float = 1.0):
+        self._shards.mine()[0] += amount
+
+    def value(self) -> float:
+        return self._shards.totals()[0]
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, amount: float = 1.0):
+        self._default.inc(amount)
+
+    def _render_child(self, values, child):
+        return [f"{self.name}{self._label_str(values)} {child.value()}"]
+
+class _GaugeChild(_CounterChild):
+    _fn: Optional[Callable[[], float]] = None
+
+    def dec(self, amount: float = 1.0):
+        self.inc(-amount)
+
+    def set_function(self, fn: Callable[[], float]):
+        """Sample fn at scrape time instead of tracking every change."""
+        self._fn = fn
+
+    def value(self) -> float:
+        return float(self._fn()) if self._fn else super().value()
+
+class Gauge(Counter):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def dec(self, amount: float = 1.0):
+        self._default.dec(amount)
+
+    def set_function(self, fn: Callable[[], float]):
+        self._default.set_function(fn)
+
+class _HistogramChild:
+    def __init__(self, buckets: Tuple[float, ...]):
+        self._buckets = buckets
+        # one slot per bucket, one for +Inf, one for the running sum
+        self._shards = _Shards(len(buckets) + 2)
+
+    def observe(self, value: float):
+        values = self._shards.mine()
+        values[bisect.bisect_left(self._buckets, value)] += 1
+        values[-1] += value
+
+    @contextmanager
+    def time(self):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start)
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300, 900, 3600)
+FAST_BUCKETS = (0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1, 5)
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (), prealloc: Sequence[Sequence[str]] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, help, labelnames, prealloc)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def observe(self, value: float):
+        self._default.observe(value)
+
+    def time(self):
+        return self._default.time()
+
+    def _render_child(self, values, child):
+        totals = child._shards.totals()
+        lines, cumulative = [], 0.0
+        for bound, count in zip(self.buckets + (float("inf"),), totals[:-1]):
+            cumulative += count
+            le = 'le="%s"' % ("+Inf" if bound == float("inf") else repr(float(bound)))
+            lines.append(f"{self.name}_bucket{self._label_str(values, le)} {cumulative}")
+        lines.append(f"{self.name}_count{self._label_str(values)} {cumulative}")
+        lines.append(f"{self.name}_sum{self._label_str(values)} {totals[-1]}")
+        return lines
+
+def render_latest() -> str:
+    """Prometheus text exposition format (version 0.0.4)."""
+    lines: List[str] = []
+    for metric in _registry:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+CONTENT_TYPE_LATEST = "text/plain; version=0.0.4; charset=utf-8"
+
+_STATUSES = [("SUCCESS",), ("FAILED",), ("TIMED_OUT",)]
+
+QUEUE_DEPTH = Gauge("ci_queue_depth", "Builds waiting in the queue")
+BUILDS_ENQUEUED = Counter("ci_builds_enqueued_total", "Builds added to the queue")
+QUEUE_WAIT = Histogram("ci_queue_wait_seconds", "Time from enqueue until a worker picks the build up")
+WORKERS_BUSY = Gauge("ci_workers_busy", "Workers currently executing a build")
+WORKER_BUSY_SECONDS = Counter("ci_worker_busy_seconds_total", "Seconds workers spent executing builds")
+PIPELINE_DURATION = Histogram("ci_pipeline_duration_seconds", "Pipeline wall time", ["status"], _STATUSES)
+STAGE_DURATION = Histogram("ci_stage_duration_seconds", "Stage wall time per attempt", ["status"], _STATUSES)
+GIT_DURATION = Histogram("ci_git_operation_seconds", "git clone/fetch latency", ["operation"], [("clone",), ("fetch",)])
+YAML_PARSE_DURATION = Histogram("ci_pipeline_yaml_parse_seconds", "parse_pipeline_yaml latency", buckets=FAST_BUCKETS)
+JUNIT_PARSE_DURATION = Histogram("ci_junit_parse_seconds", "parse_junit_reports latency")
+JUNIT_PARSE_BYTES = Counter("ci_junit_parse_bytes_total", "Bytes of JUnit XML parsed")
+LOG_INDEX_DROPPED = Counter("ci_log_index_dropped_blocks_total",
+                            "Log blocks not indexed for search because the indexer fell behind")
+RESPONSE_CACHE = Counter("ci_api_response_cache_total", "Polled listing responses by snapshot cache outcome",
+                         ["result"], [("hit",), ("miss",), ("not_modified",)])
+EVENT_LOOP_LAG = Histogram("ci_api_event_loop_lag_seconds", "How late the API event loop woke up", buckets=FAST_BUCKETS)
+NOTIFICATION_DURATION = Histogram("ci_notification_seconds", "Notification delivery latency", ["channel"],
+                                  [("email",), ("slack",)])
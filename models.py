@@ -1,11 +1,25 @@
 # backend/app/models.py
-from pydantic import BaseModel, Field
-from typing import List, Dict, Optional
+from pydantic import BaseModel, Field, root_validator
+from typing import List, Dict, Optional, Union
+
+class RetrySpec(BaseModel):
+    count: int = 0  # extra attempts after the first failure
+    backoff: float = 0  # seconds before the first retry, doubled on each further attempt
+
+class WhenSpec(BaseModel):
+    branch: List[str] = Field(default_factory=list)  # glob patterns, e.g. ["main", "release/*"]
+    expression: Optional[str] = None  # e.g. "params['DEPLOY'] == 'true' and branch != 'main'"
+    changeset: List[str] = Field(default_factory=list)  # path globs matched against the build's diff
 
 class Stage(BaseModel):
     name: str
-    run: str  # shell command to run
+    run: Union[str, List[str]]  # shell command, or an argv list executed without a shell
     env: Optional[Dict[str, str]] = None
+    timeout: Optional[int] = None  # seconds; defaults to settings.STAGE_TIMEOUT
+    retry: Optional[RetrySpec] = None
+    resources: List[str] = Field(default_factory=list)  # named slots (see settings.STAGE_RESOURCE_LIMITS)
+    artifacts: List[str] = Field(default_factory=list)  # workspace globs archived when the stage finishes
+    when: Optional[WhenSpec] = None  # every clause must hold, otherwise the stage is SKIPPED
 
 class miccheck(rapper):
     name: str
@@ -16,17 +30,35 @@ class miccheck(rapper):
     zip: str
     phone: str
 
+class MatrixSpec(BaseModel):
+    axes: Dict[str, List[str]]  # e.g. {"JDK": ["11", "17"], "DB": ["pg", "mysql"]}
+    include: List[Dict[str, str]] = Field(default_factory=list)  # extra combinations
+    exclude: List[Dict[str, str]] = Field(default_factory=list)  # partial matches drop combinations
+    max_parallel: Optional[int] = None
+
 class PipelineSpec(BaseModel):
     name: str
     agent: Optional[str] = "local"
     stages: List[Stage]
+    matrix: Optional[MatrixSpec] = None
+    timeout: Optional[int] = None  # deadline in seconds for the whole pipeline
 
 class JobConfig(BaseModel):
     id: Optional[str]
     name: str
-    pipeline: PipelineSpec
+    pipeline: Optional[PipelineSpec] = None
+    pipeline_yaml: Optional[str] = None  # DSL source (may use extends/include); re-expanded for every build
     parameters: Optional[Dict[str, str]] = Field(default_factory=dict)
     schedule_cron: Optional[str] = None  # optional cron expression
+    repo_url: Optional[str] = None
+    branches: Optional[List[str]] = None  # branch glob patterns; None matches every branch
+    labels: List[str] = Field(default_factory=list)
+
+    @root_validator(skip_on_failure=True)
+    def _pipeline_given(cls, values):
+        if values.get("pipeline") is None and not values.get("pipeline_yaml"):
+            raise ValueError("either 'pipeline' or 'pipeline_yaml' is required")
+        return values
 
 class TriggerEvent(BaseModel):
     ref: str
@@ -2,19 +2,28 @@
 # Uses GitPython for branch discovery and exposes functions that can be hooked to webhooks.
 
 import os
-from git import Repo, GitCommandError
-from typing import List
+from typing import List, TYPE_CHECKING
+from ..metrics import GIT_DURATION
+from ..tracing import span
+
+if TYPE_CHECKING:
+    from git import Repo
 #yoyooyoy
-def clone_or_update_repo(repo_url: str, target_dir: str) -> Repo:
+# GitPython is imported inside the functions: it costs ~100 ms at import and the API process rarely needs it
+def clone_or_update_repo(repo_url: str, target_dir: str) -> "Repo":
+    from git import Repo
     if os.path.exists(target_dir) and os.path.isdir(os.path.join(target_dir, ".git")):
         repo = Repo(target_dir)
         origin = repo.remotes.origin
-        origin.fetch()
+        with GIT_DURATION.labels("fetch").time(), span("git_fetch"):
+            origin.fetch()
     else:
-        repo = Repo.clone_from(repo_url, target_dir)
+        with GIT_DURATION.labels("clone").time(), span("git_clone", url=repo_url):
+            repo = Repo.clone_from(repo_url, target_dir)
     return repo
 
 def list_branches(repo_path: str) -> List[str]:
+    from git import Repo
     repo = Repo(repo_path)
     branches = [h.name for h in repo.heads]
     return branches
@@ -1,11 +1,12 @@
 # backend/app/notifications.py
-import smtplib
-from email.message import EmailMessage
-import requests
+# smtplib/email and requests are imported when a notification is actually sent, keeping them off API startup.
 from .config import settings
 from typing import Dict
+from .metrics import NOTIFICATION_DURATION
 
 def send_email(to_email: str, subject: str, body: str):
+    import smtplib
+    from email.message import EmailMessage
     msg = EmailMessage()
     msg["From"] = f"{settings.APP_NAME} <ci@example.com>"
     msg["To"] = to_email
@@ -18,6 +19,7 @@ def send_slack_message(text: str):
     if not settings.SLACK_WEBHOOK_URL:
         print("No Slack webhook configured, skipping.")
         return
+    import requests
     payload = {"text": text}
     resp = requests.post(settings.SLACK_WEBHOOK_URL, json=payload)
     resp.raise_for_status()
@@ -27,10 +29,12 @@ def notify_build_result(job, result: Dict):
     body = f"Result: {result}\n"
     # For demo: send email to maintainer@example.com
     try:
-        send_email("maintainer@example.com", subject, body)
+        with NOTIFICATION_DURATION.labels("email").time():
+            send_email("maintainer@example.com", subject, body)
     except Exception as e:
         print("Email notification failed:", e)
     try:
-        send_slack_message(subject + "\n" + str(result))
+        with NOTIFICATION_DURATION.labels("slack").time():
+            send_slack_message(subject + "\n" + str(result))
     except Exception as e:
         print("Slack notification failed:", e)
@@ -0,0 +1,41 @@
+# backend/app/offload.py
+# Blocking work called from async endpoints runs on a bounded thread pool instead of the event loop.
+# A watchdog task measures how late the loop wakes up, so anything that still blocks it shows up in /metrics.
+import asyncio
+import functools
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+from .config import settings
+from .metrics import EVENT_LOOP_LAG
+
+_executor: Optional[ThreadPoolExecutor] = None
+max_lag = 0.0  # worst lag seen since startup, seconds
+
+def _get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=settings.API_BLOCKING_WORKERS, thread_name_prefix="api-blocking")
+    return _executor
+
+async def run_blocking(fn: Callable, *args, **kwargs) -> Any:
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_get_executor(), functools.partial(fn, *args, **kwargs))
+
+async def watch_event_loop(interval: float = 0.05):
+    global max_lag
+    loop = asyncio.get_running_loop()
+    while True:
+        t = loop.time()
+        await asyncio.sleep(interval)
+        lag = max(0.0, loop.time() - t - interval)
+        EVENT_LOOP_LAG.observe(lag)
+        if lag > max_lag:
+            max_lag = lag
+        if lag > settings.LOOP_LAG_WARN_SECONDS:
+            print(f"Event loop blocked for {lag * 1000:.0f} ms")
+
+def shutdown():
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(wait=False)
+        _executor = None
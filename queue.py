@@ -1,48 +1,124 @@
 # backend/app/queue.py
-# In-memory queue + simple worker thread. Queue processing engine picks jobs, executes pipeline using engine.
+# Queue (in the shared state store) + simple worker thread. Queue processing engine picks jobs, executes pipeline using engine.
+# Workers lease items rather than popping them: a lease is renewed while the build runs and the item is
+# acked when it finishes, so with the SQLite store a build whose process died is picked up again.
+import os
+import socket
 import threading
 import time
+import uuid
 import asyncio
-from typing import Dict, Any
+from typing import Dict, Any, List, Optional, Tuple
 from .job_manager import get_job
+from .models import JobConfig
 from .pipeline.engine import run_pipeline
-from .vcs import ensure_repo
+from .pipeline.dsl_parser import parse_pipeline_yaml
+from .workspace import acquire_workspace, release_workspace
 from .notifications import notify_build_result
+from .builds import create_build, new_build, update_build
+from .pipeline.failure_analyzer import build_failure_cause, record_cause
+from .tracing import start_trace, use_trace, span
+from .state_store import get_store
+from .response_cache import notify_changed
+from .config import settings
+from .metrics import QUEUE_DEPTH, BUILDS_ENQUEUED, QUEUE_WAIT, WORKERS_BUSY, WORKER_BUSY_SECONDS
 
-_queue = []
-_lock = threading.Lock()
 _stop = False
 _worker_thread = None
+_worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:6]}"
 
-def enqueue_job(job_id: str, params: Dict[str,str]):
-    with _lock:
-        _queue.append({"job_id": job_id, "params": params, "enqueued_at": time.time()})
+QUEUE_DEPTH.set_function(lambda: get_store().queue_length())
+
+def build_params(job: JobConfig, params: Optional[Dict[str, str]]) -> Dict[str, str]:
+    """The job's parameter defaults with the trigger's values on top; placeholders, `when:` and stage env see these."""
+    return {**(job.parameters or {}), **(params or {})}
+
+def enqueue_job(job_id: str, params: Dict[str,str], context: Optional[Dict[str, Any]] = None) -> str:
+    """context describes the trigger (branch, base_branch, before) for checkout and `when:` conditions."""
+    build = create_build(job_id, params)
+    get_store().queue_push({"job_id": job_id, "build_id": build["id"], "params": params, "context": context or {},
+                            "enqueued_at": time.time()})
+    BUILDS_ENQUEUED.inc()
+    notify_changed()
+    return build["id"]
+
+def enqueue_jobs(requests: List[Tuple[str, Dict[str, str], Optional[Dict[str, Any]]]]) -> List[str]:
+    """Enqueue many (job_id, params, context) at once: builds and queue items are stored in one transaction."""
+    builds, items = [], []
+    now = time.time()
+    for job_id, params, context in requests:
+        build = new_build(job_id, params)
+        builds.append(build)
+        items.append({"job_id": job_id, "build_id": build["id"], "params": params, "context": context or {},
+                      "enqueued_at": now})
+    get_store().enqueue_many(builds, items)
+    BUILDS_ENQUEUED.inc(len(items))
+    notify_changed()
+    return [b["id"] for b in builds]
+
+def queue_version() -> str:
+    return get_store().queue_version()
 
 def queue_status():
-    with _lock:
-        return {"length": len(_queue), "items": list(_queue)}
+    items = get_store().queue_items()
+    return {"length": len(items), "items": items}
+
+def _keep_leased(build_id: str, done: threading.Event):
+    while not done.wait(settings.QUEUE_LEASE_SECONDS / 3):
+        get_store().queue_renew(build_id, _worker_id, settings.QUEUE_LEASE_SECONDS)
 
 def _process_loop():
     loop = asyncio.new_event_loop()
     asyncio.set_event_loop(loop)
     while not _stop:
-        item = None
-        with _lock:
-            if _queue:
-                item = _queue.pop(0)
+        item = get_store().queue_lease(_worker_id, settings.QUEUE_LEASE_SECONDS)
         if item:
+            notify_changed()
+            dequeued_at = time.time()
+            QUEUE_WAIT.observe(dequeued_at - item["enqueued_at"])
+            WORKERS_BUSY.inc()
+            busy_since = time.perf_counter()
+            leased = threading.Event()
+            threading.Thread(target=_keep_leased, args=(item["build_id"], leased), daemon=True).start()
             try:
                 job = get_job(item["job_id"])
                 if not job:
+                    update_build(item["build_id"], status="CANCELLED", finished_at=time.time())
                     continue
-                # for demo, ensure repo path points to job name under base path
-                repo_path = ensure_repo("https://example.com/some/repo.git", job.name)  # placeholder
-                coro = run_pipeline(job.pipeline, repo_path, params=item.get("params"))
-                res = loop.run_until_complete(coro)
-                # notify
-                notify_build_result(job, res)
+                update_build(item["build_id"], status="RUNNING", started_at=time.time())
+                trace = start_trace(item["build_id"])
+                trace.record("queue", item["enqueued_at"], dequeued_at)
+                with use_trace(trace), span("build", job=job.name):
+                    with span("workspace"):
+                        # placeholder repo when the job has none configured
+                        repo_path = acquire_workspace(job.repo_url or "https://example.com/some/repo.git",
+                                                      item["context"].get("branch"))
+                    try:
+                        pipeline = job.pipeline
+                        params = build_params(job, item.get("params"))
+                        if job.pipeline_yaml:
+                            with span("expand_pipeline"):
+                                pipeline = parse_pipeline_yaml(job.pipeline_yaml, params)
+                        coro = run_pipeline(pipeline, repo_path, params=params, build_id=item["build_id"],
+                                            context=item["context"])
+                        res = loop.run_until_complete(coro)
+                    finally:
+                        release_workspace(repo_path)
+                    cause = build_failure_cause(res) if res["status"] != "SUCCESS" else None
+                    if cause:
+                        record_cause(cause, item["build_id"])
+                    update_build(item["build_id"], status=res["status"], result=res, failure_cause=cause,
+                                 finished_at=time.time())
+                    with span("notify"):
+                        notify_build_result(job, res)
             except Exception as e:
+                update_build(item["build_id"], status="ERROR", finished_at=time.time())
                 print("Queue processing error:", e)
+            finally:
+                leased.set()
+                get_store().queue_ack(item["build_id"], _worker_id)
+                WORKERS_BUSY.dec()
+                WORKER_BUSY_SECONDS.inc(time.perf_counter() - busy_since)
         else:
             time.sleep(1)
 
@@ -0,0 +1,98 @@
+# backend/app/response_cache.py
+# Rendered snapshots of the polled listing endpoints (/queue, /jobs). A snapshot is keyed by endpoint + query
+# and tagged with the store version it was rendered at, so a poll between mutations costs one version read:
+# a matching If-None-Match gets 304, anything else gets the cached bytes (gzip'd once per version on demand).
+# Long polls wait on notify_changed() from this process and re-check the version for other processes' writes.
+import asyncio
+import collections
+import gzip
+import threading
+import zlib
+from typing import Any, Callable, List, Optional, Tuple
+from .config import settings
+from .metrics import RESPONSE_CACHE
+from .offload import run_blocking
+
+def etag_for(key: str, version: Any) -> str:
+    """Known without rendering, so an unchanged poll is answered from the version alone."""
+    return f'W/"{zlib.crc32(key.encode()):08x}-{version}"'
+
+class Snapshot:
+    def __init__(self, key: str, version: Any, body: bytes):
+        self.version = version
+        self.etag = etag_for(key, version)
+        self.body = body
+        self._gzipped: Optional[bytes] = None
+
+    def gzipped(self) -> bytes:
+        if self._gzipped is None:
+            self._gzipped = gzip.compress(self.body, compresslevel=6)
+        return self._gzipped
+
+_snapshots: "collections.OrderedDict[str, Snapshot]" = collections.OrderedDict()
+_lock = threading.Lock()
+_render_locks: "collections.defaultdict[str, threading.Lock]" = collections.defaultdict(threading.Lock)
+_waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+def snapshot(key: str, version: Any, render: Callable[[], bytes]) -> Snapshot:
+    """
+    The snapshot of key at version, rendering it if needed. version must be read before render() runs, so a
+    write racing the render only costs one extra render later, never a stale body under a new tag.
+    """
+    with _lock:
+        snap = _snapshots.get(key)
+        if snap is not None and snap.version == version:
+            _snapshots.move_to_end(key)
+            RESPONSE_CACHE.labels("hit").inc()
+            return snap
+        render_lock = _render_locks[key]
+    with render_lock:  # concurrent polls of a stale key render it once
+        with _lock:
+            snap = _snapshots.get(key)
+        if snap is not None and snap.version == version:
+            RESPONSE_CACHE.labels("hit").inc()
+            return snap
+        RESPONSE_CACHE.labels("miss").inc()
+        snap = Snapshot(key, version, render())
+        with _lock:
+            _snapshots[key] = snap
+            _snapshots.move_to_end(key)
+            while len(_snapshots) > settings.RESPONSE_CACHE_SIZE:
+                evicted, _ = _snapshots.popitem(last=False)
+                _render_locks.pop(evicted, None)
+    return snap
+
+def notify_changed():
+    """Wake long polls in this process; callable from any thread."""
+    with _lock:
+        waiters = _waiters[:]
+        _waiters.clear()
+    for loop, fut in waiters:
+        loop.call_soon_threadsafe(lambda f=fut: f.done() or f.set_result(None))
+
+async def wait_until_changed(current: Callable[[], Any], version: Any, timeout: float) -> Any:
+    """
+    Wait until current() differs from version or timeout seconds pass; returns the last version seen.
+    Writes in this process wake the wait immediately, other processes' are seen within LONG_POLL_INTERVAL.
+    current() may query the store, so it runs off the loop.
+    """
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + min(timeout, settings.LONG_POLL_MAX_SECONDS)
+    while True:
+        remaining = deadline - loop.time()
+        if remaining <= 0:
+            return version
+        fut = loop.create_future()
+        with _lock:
+            _waiters.append((loop, fut))
+        try:
+            seen = await run_blocking(current)  # registered first, so a write landing after this read still wakes us
+            if seen != version:
+                return seen
+            await asyncio.wait_for(fut, min(remaining, settings.LONG_POLL_INTERVAL))
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with _lock:
+                if (loop, fut) in _waiters:
+                    _waiters.remove((loop, fut))
@@ -0,0 +1,165 @@
+# backend/app/secret_store.py
+# Encrypted secrets for pipelines. Values are Fernet tokens in SECRETS_PATH (name -> token), keyed by
+# SECRETS_KEY; nothing is stored or logged in plaintext. Stages reference them as {{ secrets.NAME }}; a build
+# decrypts the names it uses once (decrypted values are cached for SECRETS_CACHE_TTL) and masks them in output.
+import json
+import os
+import re
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+from .config import settings
+
+SECRET_REF = re.compile(r"\{\{\s*secrets\.(\w+)\s*\}\}")
+MIN_MASK_LENGTH = 3  # masking one- or two-character values would shred every log line
+FIND_MAX = 32  # up to this many values, bytes.find beats one big alternation regex
+
+class SecretError(Exception):
+    pass
+
+_lock = threading.Lock()
+_file_cache: Tuple[Optional[float], Dict[str, Dict]] = (None, {})  # (mtime, contents)
+_decrypted: Dict[str, Tuple[str, str, float]] = {}  # name -> (token, value, expires_at)
+
+def _fernet():
+    from cryptography.fernet import Fernet  # deferred like the other optional clients
+    if not settings.SECRETS_KEY:
+        raise SecretError("SECRETS_KEY is not configured")
+    return Fernet(settings.SECRETS_KEY.encode())
+
+def _load() -> Dict[str, Dict]:
+    global _file_cache
+    try:
+        mtime = os.stat(settings.SECRETS_PATH).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    if _file_cache[0] != mtime:
+        with open(settings.SECRETS_PATH) as f:
+            _file_cache = (mtime, json.load(f))
+    return _file_cache[1]
+
+def _save(entries: Dict[str, Dict]):
+    os.makedirs(os.path.dirname(settings.SECRETS_PATH) or ".", exist_ok=True)
+    tmp = settings.SECRETS_PATH + ".tmp"
+    fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "w") as f:
+        json.dump(entries, f)
+    os.replace(tmp, settings.SECRETS_PATH)
+
+def set_secret(name: str, value: str):
+    if not re.fullmatch(r"\w+", name):
+        raise SecretError(f"Invalid secret name {name!r}")
+    token = _fernet().encrypt(value.encode()).decode()
+    with _lock:
+        entries = dict(_load())
+        entries[name] = {"token": token, "updated_at": time.time()}
+        _save(entries)
+        _decrypted.pop(name, None)
+
+def delete_secret(name: str) -> bool:
+    with _lock:
+        entries = dict(_load())
+        if entries.pop(name, None) is None:
+            return False
+        _save(entries)
+        _decrypted.pop(name, None)
+    return True
+
+def list_secrets() -> List[Dict]:
+    return [{"name": n, "updated_at": e["updated_at"]} for n, e in sorted(_load().items())]
+
+def referenced_secrets(texts: Iterable[str]) -> List[str]:
+    return sorted({m for t in texts if t for m in SECRET_REF.findall(t)})
+
+def resolve_secrets(names: Iterable[str]) -> Dict[str, str]:
+    """Plaintext values for names; a value is decrypted again only when its TTL ran out or it was changed."""
+    names = list(names)
+    if not names:
+        return {}
+    entries = _load()
+    now = time.time()
+    values, fernet = {}, None
+    for name in names:
+        entry = entries.get(name)
+        if entry is None:
+            raise SecretError(f"Unknown secret '{name}'")
+        cached = _decrypted.get(name)
+        if cached and cached[0] == entry["token"] and cached[2] > now:
+            values[name] = cached[1]
+            continue
+        fernet = fernet or _fernet()
+        try:
+            value = fernet.decrypt(entry["token"].encode()).decode()
+        except Exception:
+            raise SecretError(f"Secret '{name}' cannot be decrypted with the configured key")
+        _decrypted[name] = (entry["token"], value, now + settings.SECRETS_CACHE_TTL)
+        values[name] = value
+    return values
+
+def secret_env_name(name: str) -> str:
+    return f"CI_SECRET_{name}"
+
+class MaskSet:
+    """The secret values of one build compiled into a single alternation, longest first."""
+    def __init__(self, values: Iterable[str]):
+        needles = sorted({v.encode() for v in values if len(v) >= MIN_MASK_LENGTH}, key=len, reverse=True)
+        self.rx = re.compile(b"|".join(re.escape(n) for n in needles)) if needles else None
+        self.needles = needles if len(needles) <= FIND_MAX else None
+        self.keep = max((len(n) for n in needles), default=1) - 1
+        self.mask = settings.SECRET_MASK.encode()
+
+    def stream(self) -> "Masker":
+        return Masker(self)
+
+class Masker:
+    """
+    Streaming replacer for one output stream. The last (longest secret - 1) bytes are held back so a value
+    split across reads is still caught; a match starting before that point always has the bytes to be the
+    longest alternative, so it is final.
+    """
+    def __init__(self, masks: MaskSet):
+        self.rx, self.keep, self.mask, self.needles = masks.rx, masks.keep, masks.mask, masks.needles
+        self.buf = b""
+
+    def feed(self, chunk: bytes) -> bytes:
+        if self.rx is None:
+            return chunk
+        buf = self.buf + chunk if self.buf else chunk
+        cut = max(0, len(buf) - self.keep)
+        out, pos = [], 0
+        for start, end in self._matches(buf):
+            if start >= cut:
+                break
+            out.append(buf[pos:start])
+            out.append(self.mask)
+            pos = end
+        if not out:
+            self.buf = buf[cut:]
+            return buf[:cut]
+        cut = max(cut, pos)
+        out.append(buf[pos:cut])
+        self.buf = buf[cut:]
+        return b"".join(out)
+
+    def _matches(self, buf: bytes):
+        """Leftmost, longest-first, non-overlapping matches: the same ones rx.finditer would yield."""
+        if self.needles is None:
+            return [m.span() for m in self.rx.finditer(buf)]
+        hits = []
+        for n in self.needles:
+            i = buf.find(n)
+            while i != -1:
+                hits.append((i, -len(n)))
+                i = buf.find(n, i + 1)
+        spans, pos = [], 0
+        for start, neg_len in sorted(hits):
+            if start >= pos:
+                spans.append((start, start - neg_len))
+                pos = start - neg_len
+        return spans
+
+    def flush(self) -> bytes:
+        if self.rx is None:
+            return b""
+        rest, self.buf = self.buf, b""
+        return self.rx.sub(self.mask, rest)
@@ -0,0 +1,357 @@
+# backend/app/state_store.py
+# Shared state behind one interface so several server processes (uvicorn --workers N, several hosts on a
+# shared volume) see the same jobs, queue and builds. STATE_BACKEND=memory keeps everything in this process
+# (the single-process default); STATE_BACKEND=sqlite uses one WAL database where dequeue is an atomic
+# lease (crashed workers' items come back when the lease expires) and a named lease elects one scheduler.
+import collections
+import contextlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Dict, List, Optional, Tuple
+from .config import settings
+
+BuildRow = Tuple[str, str, str, Optional[float], float]  # id, job_id, status, finished_at, created_at
+
+class MemoryStore:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._queue: "collections.deque[Dict[str, Any]]" = collections.deque()
+        self._leased: Dict[str, Dict[str, Any]] = {}
+        self._builds: Dict[str, Dict[str, Any]] = {}
+        self._jobs: Dict[str, str] = {}
+        self._jobs_version = 0
+        self._queue_version = 0
+        self._leases: Dict[str, Tuple[str, float]] = {}
+        self._causes: Dict[str, Dict[str, Any]] = {}
+
+    # queue
+    def queue_push(self, item: Dict[str, Any]):
+        with self._lock:
+            self._queue.append(item)
+            self._queue_version += 1
+
+    def enqueue_many(self, builds: List[Dict[str, Any]], items: List[Dict[str, Any]]):
+        with self._lock:
+            for build in builds:
+                self._builds[build["id"]] = build
+            self._queue.extend(items)
+            self._queue_version += 1
+
+    def queue_lease(self, holder: str, seconds: float) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            if not self._queue:
+                return None
+            item = self._queue.popleft()
+            self._leased[item["build_id"]] = item
+            self._queue_version += 1
+            return item
+
+    def queue_renew(self, build_id: str, holder: str, seconds: float) -> bool:
+        return build_id in self._leased
+
+    def queue_ack(self, build_id: str, holder: str):
+        with self._lock:
+            self._leased.pop(build_id, None)
+
+    def queue_length(self) -> int:
+        return len(self._queue)
+
+    def queue_items(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return list(self._queue)
+
+    def queue_version(self) -> str:
+        """Changes whenever queue_items would."""
+        return str(self._queue_version)
+
+    # builds
+    def build_put(self, build: Dict[str, Any]):
+        with self._lock:
+            self._builds[build["id"]] = build
+
+    def build_update(self, build_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            build = self._builds.get(build_id)
+            if build:
+                build.update(fields)
+            return build
+
+    def build_get(self, build_id: str) -> Optional[Dict[str, Any]]:
+        return self._builds.get(build_id)
+
+    def build_delete(self, build_id: str) -> bool:
+        with self._lock:
+            return self._builds.pop(build_id, None) is not None
+
+    def build_snapshot(self) -> List[BuildRow]:
+        with self._lock:
+            return [(b["id"], b["job_id"], b["status"], b["finished_at"], b["created_at"]) for b in self._builds.values()]
+
+    def build_list(self, job_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            builds = [b for b in self._builds.values() if job_id is None or b["job_id"] == job_id]
+        return builds[-limit:][::-1]
+
+    # jobs: serialized configs plus a version bumped on every change
+    def job_put(self, job_id: str, data: str) -> int:
+        return self.job_put_many([(job_id, data)])
+
+    def job_put_many(self, jobs: List[Tuple[str, str]]) -> int:
+        with self._lock:
+            self._jobs.update(jobs)
+            self._jobs_version += 1
+            return self._jobs_version
+
+    def job_delete(self, job_id: str) -> int:
+        with self._lock:
+            self._jobs.pop(job_id, None)
+            self._jobs_version += 1
+            return self._jobs_version
+
+    def jobs_version(self) -> int:
+        return self._jobs_version
+
+    def jobs_all(self) -> Tuple[int, List[Tuple[str, str]]]:
+        with self._lock:
+            return self._jobs_version, list(self._jobs.items())
+
+    # failure causes: running totals per fingerprint across builds
+    def cause_record(self, cause: Dict[str, str], build_id: str):
+        with self._lock:
+            entry = self._causes.get(cause["fingerprint"])
+            if entry is None:
+                entry = self._causes[cause["fingerprint"]] = {
+                    "fingerprint": cause["fingerprint"], "category": cause["category"], "kind": cause["kind"],
+                    "signature": cause["signature"], "count": 0}
+            entry["count"] += 1
+            entry["last_build"] = build_id
+
+    def cause_top(self, limit: int, category: Optional[str]) -> List[Dict[str, Any]]:
+        with self._lock:
+            entries = [dict(e) for e in self._causes.values() if category is None or e["category"] == category]
+        return sorted(entries, key=lambda e: e["count"], reverse=True)[:limit]
+
+    # leases
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._lock:
+            current = self._leases.get(name)
+            if current and current[0] != holder and current[1] > now:
+                return False
+            self._leases[name] = (holder, now + ttl)
+            return True
+
+    def release_lease(self, name: str, holder: str):
+        with self._lock:
+            if self._leases.get(name, (None,))[0] == holder:
+                del self._leases[name]
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS queue (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT, build_id TEXT UNIQUE, data TEXT,
+    leased_by TEXT, lease_until REAL NOT NULL DEFAULT 0
+);
+CREATE INDEX IF NOT EXISTS queue_ready ON queue(lease_until, seq);
+CREATE TABLE IF NOT EXISTS builds (
+    id TEXT PRIMARY KEY, job_id TEXT, status TEXT, created_at REAL, finished_at REAL, data TEXT
+);
+CREATE INDEX IF NOT EXISTS builds_job ON builds(job_id, created_at);
+CREATE TABLE IF NOT EXISTS jobs (id TEXT PRIMARY KEY, seq INTEGER, data TEXT);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value INTEGER);
+CREATE TABLE IF NOT EXISTS leases (name TEXT PRIMARY KEY, holder TEXT, expires_at REAL);
+CREATE TABLE IF NOT EXISTS causes (
+    fingerprint TEXT PRIMARY KEY, category TEXT, kind TEXT, signature TEXT, count INTEGER, last_build TEXT
+);
+CREATE INDEX IF NOT EXISTS causes_count ON causes(count);
+"""
+
+class SQLiteStore:
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._conn().executescript(_SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # autocommit mode; writes go through _tx so every read-modify-write holds the write lock
+            conn = self._local.conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+        return conn
+
+    @contextlib.contextmanager
+    def _tx(self):
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield conn
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        conn.execute("COMMIT")
+
+    # queue
+    def queue_push(self, item: Dict[str, Any]):
+        self._conn().execute("INSERT INTO queue (build_id, data) VALUES (?, ?)", (item["build_id"], json.dumps(item)))
+
+    def enqueue_many(self, builds: List[Dict[str, Any]], items: List[Dict[str, Any]]):
+        with self._tx() as conn:
+            conn.executemany("INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?)",
+                             [(b["id"], b["job_id"], b["status"], b["created_at"], b["finished_at"],
+                               json.dumps(b, default=str)) for b in builds])
+            conn.executemany("INSERT INTO queue (build_id, data) VALUES (?, ?)",
+                             [(i["build_id"], json.dumps(i)) for i in items])
+
+    def queue_lease(self, holder: str, seconds: float) -> Optional[Dict[str, Any]]:
+        now = time.time()
+        with self._tx() as conn:
+            row = conn.execute("SELECT seq, data FROM queue WHERE lease_until < ? ORDER BY seq LIMIT 1", (now,)).fetchone()
+            if row is None:
+                return None
+            conn.execute("UPDATE queue SET leased_by = ?, lease_until = ? WHERE seq = ?", (holder, now + seconds, row[0]))
+        return json.loads(row[1])
+
+    def queue_renew(self, build_id: str, holder: str, seconds: float) -> bool:
+        cur = self._conn().execute("UPDATE queue SET lease_until = ? WHERE build_id = ? AND leased_by = ?",
+                                   (time.time() + seconds, build_id, holder))
+        return cur.rowcount > 0
+
+    def queue_ack(self, build_id: str, holder: str):
+        # only the current lease holder may remove the item: a worker whose lease expired and was taken over
+        # must not drop the build another worker is now running
+        self._conn().execute("DELETE FROM queue WHERE build_id = ? AND leased_by = ?", (build_id, holder))
+
+    def queue_length(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM queue WHERE lease_until < ?", (time.time(),)).fetchone()[0]
+
+    def queue_items(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT data FROM queue WHERE lease_until < ? ORDER BY seq", (time.time(),))
+        return [json.loads(r[0]) for r in rows]
+
+    def queue_version(self) -> str:
+        # derived from the waiting rows (an index scan, no JSON) so expired leases coming back count as a change
+        # without every lease/ack paying for a counter write
+        row = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(seq), 0), COALESCE(MAX(seq), 0) FROM queue "
+                                   "WHERE lease_until < ?", (time.time(),)).fetchone()
+        return "%d.%d.%d" % tuple(row)
+
+    # builds
+    def build_put(self, build: Dict[str, Any]):
+        self._conn().execute("INSERT OR REPLACE INTO builds VALUES (?, ?, ?, ?, ?, ?)",
+                             (build["id"], build["job_id"], build["status"], build["created_at"],
+                              build["finished_at"], json.dumps(build, default=str)))
+
+    def build_update(self, build_id: str, fields: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        with self._tx() as conn:
+            row = conn.execute("SELECT data FROM builds WHERE id = ?", (build_id,)).fetchone()
+            if row is None:
+                return None
+            build = {**json.loads(row[0]), **fields}
+            conn.execute("UPDATE builds SET status = ?, finished_at = ?, data = ? WHERE id = ?",
+                         (build["status"], build["finished_at"], json.dumps(build, default=str), build_id))
+        return build
+
+    def build_get(self, build_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM builds WHERE id = ?", (build_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def build_delete(self, build_id: str) -> bool:
+        return self._conn().execute("DELETE FROM builds WHERE id = ?", (build_id,)).rowcount > 0
+
+    def build_snapshot(self) -> List[BuildRow]:
+        return [tuple(r) for r in self._conn().execute(
+            "SELECT id, job_id, status, finished_at, created_at FROM builds")]
+
+    def build_list(self, job_id: Optional[str], limit: int) -> List[Dict[str, Any]]:
+        if job_id is None:
+            rows = self._conn().execute("SELECT data FROM builds ORDER BY created_at DESC LIMIT ?", (limit,))
+        else:
+            rows = self._conn().execute("SELECT data FROM builds WHERE job_id = ? ORDER BY created_at DESC LIMIT ?",
+                                        (job_id, limit))
+        return [json.loads(r[0]) for r in rows]
+
+    # jobs
+    def _bump(self, conn) -> int:
+        conn.execute("INSERT INTO meta VALUES ('jobs_version', 1) "
+                     "ON CONFLICT(key) DO UPDATE SET value = value + 1")
+        return conn.execute("SELECT value FROM meta WHERE key = 'jobs_version'").fetchone()[0]
+
+    def job_put(self, job_id: str, data: str) -> int:
+        return self.job_put_many([(job_id, data)])
+
+    def job_put_many(self, jobs: List[Tuple[str, str]]) -> int:
+        """Insert or update jobs in one transaction with a single version bump."""
+        with self._tx() as conn:
+            # an update keeps the job's original position in listings
+            conn.executemany("INSERT INTO jobs VALUES (?, (SELECT COALESCE(MAX(seq), 0) + 1 FROM jobs), ?) "
+                             "ON CONFLICT(id) DO UPDATE SET data = excluded.data", jobs)
+            return self._bump(conn)
+
+    def job_delete(self, job_id: str) -> int:
+        with self._tx() as conn:
+            conn.execute("DELETE FROM jobs WHERE id = ?", (job_id,))
+            return self._bump(conn)
+
+    def jobs_version(self) -> int:
+        row = self._conn().execute("SELECT value FROM meta WHERE key = 'jobs_version'").fetchone()
+        return row[0] if row else 0
+
+    def jobs_all(self) -> Tuple[int, List[Tuple[str, str]]]:
+        conn = self._conn()
+        conn.execute("BEGIN")  # version and rows from one snapshot
+        try:
+            row = conn.execute("SELECT value FROM meta WHERE key = 'jobs_version'").fetchone()
+            jobs = [tuple(r) for r in conn.execute("SELECT id, data FROM jobs ORDER BY seq")]
+        finally:
+            conn.execute("COMMIT")
+        return (row[0] if row else 0), jobs
+
+    # failure causes
+    def cause_record(self, cause: Dict[str, str], build_id: str):
+        self._conn().execute("INSERT INTO causes VALUES (?, ?, ?, ?, 1, ?) ON CONFLICT(fingerprint) "
+                             "DO UPDATE SET count = count + 1, last_build = excluded.last_build",
+                             (cause["fingerprint"], cause["category"], cause["kind"], cause["signature"], build_id))
+
+    def cause_top(self, limit: int, category: Optional[str]) -> List[Dict[str, Any]]:
+        sql = "SELECT fingerprint, category, kind, signature, count, last_build FROM causes"
+        args: List[Any] = []
+        if category is not None:
+            sql += " WHERE category = ?"
+            args.append(category)
+        rows = self._conn().execute(sql + " ORDER BY count DESC LIMIT ?", (*args, limit))
+        return [dict(zip(("fingerprint", "category", "kind", "signature", "count", "last_build"), r)) for r in rows]
+
+    # leases
+    def acquire_lease(self, name: str, holder: str, ttl: float) -> bool:
+        now = time.time()
+        with self._tx() as conn:
+            row = conn.execute("SELECT holder, expires_at FROM leases WHERE name = ?", (name,)).fetchone()
+            if row and row[0] != holder and row[1] > now:
+                return False
+            conn.execute("INSERT OR REPLACE INTO leases VALUES (?, ?, ?)", (name, holder, now + ttl))
+        return True
+
+    def release_lease(self, name: str, holder: str):
+        self._conn().execute("DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder))
+
+_store = None
+_store_lock = threading.Lock()
+
+def get_store():
+    """The configured backend, created on first use."""
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                if settings.STATE_BACKEND == "sqlite":
+                    _store = SQLiteStore(settings.STATE_DB)
+                elif settings.STATE_BACKEND == "memory":
+                    _store = MemoryStore()
+                else:
+                    raise ValueError(f"Unknown STATE_BACKEND {settings.STATE_BACKEND!r}")
+    return _store
@@ -0,0 +1,188 @@
+# backend/app/pipeline/templates.py
+# Shared pipeline templates for `extends:` / `include:`. A reference is either a path under TEMPLATE_PATH
+# ("templates/maven.yaml") or "<library>@<ref>:<path>" for a library repo listed in TEMPLATE_LIBRARIES.
+# Parsed templates are cached by (version, source, path) where the version is the commit SHA the ref
+# resolved to (or mtime/size for local files), so each template is fetched and parsed once per change.
+import copy
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Tuple, TYPE_CHECKING
+from ..config import settings
+
+if TYPE_CHECKING:
+    from git import Repo
+
+MAX_DEPTH = 10
+MEMO_SIZE = 256
+
+class TemplateError(Exception):
+    pass
+
+_LIB_REF = re.compile(r"^(?P<lib>[\w.-]+)@(?P<ref>[^:]+):(?P<path>.+)$")
+_SHA = re.compile(r"^[0-9a-f]{40}$")
+
+_parsed: "OrderedDict[Tuple[str, str, str], Dict[str, Any]]" = OrderedDict()  # (version, source, path) -> parsed YAML, LRU
+_ref_shas: Dict[Tuple[str, str], Tuple[str, float]] = {}  # (library, ref) -> (sha, resolved at)
+_lib_locks: Dict[str, threading.Lock] = {}
+_lock = threading.Lock()
+
+def _remember(cache: OrderedDict, key, value):
+    with _lock:
+        cache[key] = value
+        cache.move_to_end(key)
+        while len(cache) > MEMO_SIZE:
+            cache.popitem(last=False)
+
+def _recall(cache: OrderedDict, key):
+    with _lock:
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+def _library_repo(lib: str) -> "Repo":
+    from git import Repo
+    url = settings.TEMPLATE_LIBRARIES.get(lib)
+    if not url:
+        raise TemplateError(f"Unknown template library '{lib}'")
+    path = os.path.join(settings.TEMPLATE_CACHE_PATH, lib + ".git")
+    if os.path.isdir(path):
+        return Repo(path)
+    os.makedirs(settings.TEMPLATE_CACHE_PATH, exist_ok=True)
+    return Repo.clone_from(url, path, bare=True)
+
+def _resolve_ref(lib: str, ref: str) -> str:
+    """Commit SHA for a library ref; branch/tag lookups are reused for TEMPLATE_REF_TTL seconds."""
+    if _SHA.match(ref):
+        return ref
+    cached = _ref_shas.get((lib, ref))
+    if cached and time.time() - cached[1] < settings.TEMPLATE_REF_TTL:
+        return cached[0]
+    from git import GitCommandError
+    with _lock:
+        lib_lock = _lib_locks.setdefault(lib, threading.Lock())
+    with lib_lock:
+        try:
+            repo = _library_repo(lib)
+            repo.remotes.origin.fetch("+refs/heads/*:refs/heads/*", "+refs/tags/*:refs/tags/*", prune=True)
+            sha = repo.git.rev_parse(f"{ref}^{{commit}}")
+        except GitCommandError as e:
+            raise TemplateError(f"Cannot resolve {lib}@{ref}: {e}")
+    _ref_shas[(lib, ref)] = (sha, time.time())
+    return sha
+
+def _load(source: str, version: str, path: str, read) -> Dict[str, Any]:
+    key = (version, source, path)
+    doc = _recall(_parsed, key)
+    if doc is None:
+        import yaml
+        try:
+            doc = yaml.safe_load(read()) or {}
+        except yaml.YAMLError as e:
+            raise TemplateError(f"Template {path} is not valid YAML: {e}")
+        if not isinstance(doc, dict):
+            raise TemplateError(f"Template {path} must be a mapping")
+        _remember(_parsed, key, doc)
+    return copy.deepcopy(doc)
+
+def load_template(ref: str) -> Tuple[Dict[str, Any], str]:
+    """(parsed template, version string) for a template reference."""
+    m = _LIB_REF.match(ref)
+    if m:
+        lib, path = m.group("lib"), m.group("path")
+        sha = _resolve_ref(lib, m.group("ref"))
+
+        def read():
+            from git import GitCommandError
+            try:
+                return _library_repo(lib).git.show(f"{sha}:{path}")
+            except GitCommandError:
+                raise TemplateError(f"Template {path} not found in {lib}@{sha[:12]}")
+        return _load(lib, sha, path, read), f"{lib}@{sha}:{path}"
+    base = os.path.realpath(settings.TEMPLATE_PATH)
+    full = os.path.realpath(os.path.join(base, ref))
+    if not full.startswith(base + os.sep):
+        raise TemplateError(f"Template path escapes TEMPLATE_PATH: {ref}")
+    try:
+        st = os.stat(full)
+    except FileNotFoundError:
+        raise TemplateError(f"Template not found: {ref}")
+    version = f"{st.st_mtime_ns}-{st.st_size}"
+
+    def read():
+        with open(full) as f:
+            return f.read()
+    return _load("local", version, ref, read), f"{ref}@{version}"
+
+def template_versions(raw: Dict[str, Any], depth: int = 0) -> Tuple[str, ...]:
+    """Versions of every template reachable from raw; the memo key for an expanded pipeline."""
+    if depth > MAX_DEPTH:
+        raise TemplateError("Template nesting too deep (cycle?)")
+    versions = []
+    for ref in _refs(raw):
+        doc, version = load_template(ref)
+        versions.append(version)
+        versions.extend(template_versions(doc, depth + 1))
+    return tuple(versions)
+
+def _refs(raw: Dict[str, Any]):
+    if raw.get("extends"):
+        yield raw["extends"]
+    includes = raw.get("include") or []
+    yield from ([includes] if isinstance(includes, str) else includes)
+
+def _merge_stages(base, override):
+    # stages with the same name are replaced in place, new ones are appended
+    merged = list(base or [])
+    index = {s.get("name"): i for i, s in enumerate(merged) if isinstance(s, dict)}
+    for s in override or []:
+        name = s.get("name") if isinstance(s, dict) else None
+        if name in index:
+            merged[index[name]] = s
+        else:
+            merged.append(s)
+    return merged
+
+def expand(raw: Dict[str, Any], depth: int = 0) -> Dict[str, Any]:
+    """Resolve include/extends recursively; the result has neither key left."""
+    if depth > MAX_DEPTH:
+        raise TemplateError("Template nesting too deep (cycle?)")
+    raw = dict(raw)
+    includes = raw.pop("include", None) or []
+    parent_ref = raw.pop("extends", None)
+    result: Dict[str, Any] = {}
+    if parent_ref:
+        result = expand(load_template(parent_ref)[0], depth + 1)
+    for ref in [includes] if isinstance(includes, str) else includes:
+        fragment = expand(load_template(ref)[0], depth + 1)
+        result["stages"] = _merge_stages(result.get("stages"), fragment.pop("stages", None))
+        result["parameters"] = {**fragment.pop("parameters", {}), **result.get("parameters", {})}
+        for k, v in fragment.items():
+            result.setdefault(k, v)
+    for k, v in raw.items():
+        if k == "stages":
+            result["stages"] = _merge_stages(result.get("stages"), v)
+        elif k == "parameters":
+            result["parameters"] = {**result.get("parameters", {}), **(v or {})}
+        else:
+            result[k] = v
+    return result
+
+_PLACEHOLDER = re.compile(r"\{\{\s*(\w+)\s*\}\}")
+
+def substitute(value: Any, params: Dict[str, str]) -> Any:
+    """Replace {{ NAME }} in every string; dotted names such as {{ secrets.X }} are left alone."""
+    if isinstance(value, str):
+        def repl(m):
+            if m.group(1) not in params:
+                raise TemplateError(f"Unknown template parameter '{m.group(1)}'")
+            return str(params[m.group(1)])
+        return _PLACEHOLDER.sub(repl, value)
+    if isinstance(value, list):
+        return [substitute(v, params) for v in value]
+    if isinstance(value, dict):
+        return {k: substitute(v, params) for k, v in value.items()}
+    return value
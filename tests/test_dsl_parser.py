@@ -0,0 +1,39 @@
+# tests/test_dsl_parser.py
+# Parser validation: bad field values must raise DSLParseError (a 400 from /pipelines/parse), never a 500.
+# Like bench/ci_bench.py these import the server as the backend.app package and are skipped without it.
+import pytest
+
+dsl_parser = pytest.importorskip("backend.app.pipeline.dsl_parser")
+parse_pipeline_yaml, DSLParseError = dsl_parser.parse_pipeline_yaml, dsl_parser.DSLParseError
+
+def _stage(extra: str) -> str:
+    return "name: p\nstages:\n  - name: build\n    run: make\n" + "".join(f"    {line}\n" for line in extra.splitlines())
+
+@pytest.mark.parametrize("extra", [
+    "timeout: abc",
+    "timeout: -3",
+    "timeout: 0",
+    "timeout: true",
+    "retry: true",
+    "retry: -1",
+    "retry: {count: x}",
+    "retry: {count: 1.5}",
+    "retry: {count: 2, backoff: soon}",
+    "retry: {count: 2, backoff: -1}",
+    "resources: db",
+    "resources: [db, 3]",
+])
+def test_bad_stage_fields_raise_parse_error(extra):
+    with pytest.raises(DSLParseError, match="Stage 'build'"):
+        parse_pipeline_yaml(_stage(extra))
+
+@pytest.mark.parametrize("timeout", ["soon", "-3", "true"])
+def test_bad_pipeline_timeout_raises_parse_error(timeout):
+    with pytest.raises(DSLParseError, match="Pipeline: 'timeout'"):
+        parse_pipeline_yaml(f"name: p\ntimeout: {timeout}\nstages: [{{name: build, run: make}}]\n")
+
+def test_valid_fields_are_kept():
+    p = parse_pipeline_yaml(_stage("timeout: 30\nretry: {count: 2, backoff: 0.5}\nresources: [db]"))
+    stage = p.stages[0]
+    assert (stage.timeout, stage.retry.count, stage.retry.backoff, stage.resources) == (30, 2, 0.5, ["db"])
+    assert parse_pipeline_yaml(_stage("retry: 0")).stages[0].retry.count == 0
@@ -0,0 +1,32 @@
+# tests/test_queue.py
+# Job parameter defaults must reach a build the same way trigger params do. Skipped without the backend.app package.
+import asyncio
+import pytest
+
+queue = pytest.importorskip("backend.app.queue")
+from backend.app.models import JobConfig
+from backend.app.pipeline.dsl_parser import parse_pipeline_yaml
+from backend.app.pipeline.engine import run_pipeline
+
+PIPELINE = """
+name: p
+stages:
+  - name: it
+    run: test "$MODE" = fast
+    when: "params['RUN_IT'] == 'true'"
+"""
+
+def _job() -> JobConfig:
+    return JobConfig(name="j", pipeline_yaml=PIPELINE, parameters={"RUN_IT": "true", "MODE": "fast"})
+
+def test_trigger_params_override_defaults():
+    job = _job()
+    assert queue.build_params(job, {"MODE": "full"}) == {"RUN_IT": "true", "MODE": "full"}
+    assert queue.build_params(job, None) == {"RUN_IT": "true", "MODE": "fast"}
+
+@pytest.mark.parametrize("trigger, status", [({}, "SUCCESS"), ({"RUN_IT": "false"}, "SKIPPED")])
+def test_defaults_reach_when_and_stage_env(tmp_path, trigger, status):
+    job = _job()
+    params = queue.build_params(job, trigger)
+    result = asyncio.run(run_pipeline(parse_pipeline_yaml(job.pipeline_yaml, params), str(tmp_path), params=params))
+    assert result["stages"][0]["status"] == status
@@ -2,16 +2,25 @@
 import xml.etree.ElementTree as ET
 from typing import Dict, Any, List
 import os
+import time
+from .metrics import JUNIT_PARSE_DURATION, JUNIT_PARSE_BYTES
+from .tracing import span
 
 def parse_junit_reports(report_dir: str) -> Dict[str, Any]:
+    with span("junit_parse", report_dir=report_dir):
+        return _parse_junit_reports(report_dir)
+
+def _parse_junit_reports(report_dir: str) -> Dict[str, Any]:
     results = {"tests": 0, "failures": 0, "errors": 0, "skipped": 0, "cases": []}
     if not os.path.isdir(report_dir):
         return results
+    start = time.perf_counter()
     for fname in os.listdir(report_dir):
         if not fname.endswith(".xml"):
             continue
         path = os.path.join(report_dir, fname)
         try:
+            JUNIT_PARSE_BYTES.inc(os.path.getsize(path))
             tree = ET.parse(path)
             root = tree.getroot()
             # junit xml may have testsuites root or testsuite root
@@ -35,4 +44,5 @@ def parse_junit_reports(report_dir: str) -> Dict[str, Any]:
                 })
         except Exception:
             continue
+    JUNIT_PARSE_DURATION.observe(time.perf_counter() - start)
     return results
@@ -0,0 +1,72 @@
+# backend/app/pipeline/toolchains.py
+# The environment stages start from, computed once per agent process: an allow-list of inherited variables
+# (PATH, HOME, JAVA_HOME, ...) plus AGENT_ENV, and the JDK/Maven installations found on this machine.
+# Discovery only reads files (JDK `release` files, symlinks on PATH), so it never spawns a process.
+import functools
+import glob
+import os
+import re
+import shutil
+from typing import Dict, Optional
+from ..config import settings
+
+_JAVA_VERSION = re.compile(r'^JAVA_VERSION="([^"]+)"', re.M)
+
+def _jdk_version(home: str) -> Optional[str]:
+    """Feature version ("17", "1.8" -> "8") from the JDK's release file."""
+    try:
+        with open(os.path.join(home, "release")) as f:
+            m = _JAVA_VERSION.search(f.read())
+    except OSError:
+        return None
+    if not m:
+        return None
+    parts = m.group(1).split(".")
+    return parts[1] if parts[0] == "1" and len(parts) > 1 else parts[0]
+
+def _home_of(executable: Optional[str]) -> Optional[str]:
+    # .../bin/java -> ... after resolving alternatives/symlinks
+    return os.path.dirname(os.path.dirname(os.path.realpath(executable))) if executable else None
+
+@functools.lru_cache(maxsize=None)
+def toolchains() -> Dict:
+    """{"java_home", "maven_home", "jdks": {feature version: home}} for this agent; computed once."""
+    jdks: Dict[str, str] = {}
+    for pattern in settings.TOOLCHAIN_JDK_DIRS:
+        for home in sorted(glob.glob(os.path.join(pattern, "*"))):
+            home = os.path.join(home, "Contents", "Home") if os.path.isdir(os.path.join(home, "Contents", "Home")) else home
+            version = _jdk_version(home)
+            if version and os.path.exists(os.path.join(home, "bin", "java")):
+                jdks.setdefault(version, home)
+    java_home = os.environ.get("JAVA_HOME") or _home_of(shutil.which("java"))
+    if java_home and _jdk_version(java_home):
+        jdks.setdefault(_jdk_version(java_home), java_home)
+    maven_home = os.environ.get("MAVEN_HOME") or os.environ.get("M2_HOME") or _home_of(shutil.which("mvn"))
+    return {"java_home": java_home, "maven_home": maven_home, "jdks": jdks}
+
+@functools.lru_cache(maxsize=None)
+def _base_env() -> Dict[str, str]:
+    env = {k: os.environ[k] for k in settings.AGENT_ENV_INHERIT if k in os.environ}
+    tools = toolchains()
+    if tools["java_home"]:
+        env.setdefault("JAVA_HOME", tools["java_home"])
+    if tools["maven_home"]:
+        env.setdefault("MAVEN_HOME", tools["maven_home"])
+    env.update(settings.AGENT_ENV)
+    return env
+
+def base_env() -> Dict[str, str]:
+    """A fresh copy of the agent's base environment for one stage."""
+    return dict(_base_env())
+
+def select_jdk(env: Dict[str, str]):
+    """A `JDK` variable (e.g. a matrix axis) naming a discovered JDK switches JAVA_HOME and PATH to it."""
+    home = toolchains()["jdks"].get(env.get("JDK", ""))
+    if home:
+        env["JAVA_HOME"] = home
+        env["PATH"] = os.path.join(home, "bin") + os.pathsep + env.get("PATH", os.defpath)
+
+@functools.lru_cache(maxsize=1024)
+def which(program: str, path: str) -> Optional[str]:
+    """Cached PATH lookup, so exec-form stages don't pay for a directory walk (or failed execs) each spawn."""
+    return shutil.which(program, path=path)
@@ -0,0 +1,101 @@
+# backend/app/tracing.py
+# Per-build spans in the OpenTelemetry shape (trace id = build id, span id, parent id, start/end, attributes).
+# The active trace and span travel in contextvars, so asyncio tasks spawned for matrix cells inherit them.
+import contextvars
+import itertools
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Any, Dict, List, Optional
+
+MAX_TRACES = 1000  # most recent builds kept in memory
+
+_current_trace: contextvars.ContextVar = contextvars.ContextVar("ci_trace", default=None)
+_current_span: contextvars.ContextVar = contextvars.ContextVar("ci_span", default=None)
+_traces: "OrderedDict[str, BuildTrace]" = OrderedDict()
+_lock = threading.Lock()
+
+class BuildTrace:
+    def __init__(self, build_id: str):
+        self.build_id = build_id
+        self.spans: List[Dict[str, Any]] = []
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def record(self, name: str, start: float, end: Optional[float] = None, parent_id: Optional[int] = None,
+               **attributes) -> Dict[str, Any]:
+        span = {"trace_id": self.build_id, "span_id": next(self._ids), "parent_id": parent_id, "name": name,
+                "start": start, "end": end, "status": "OK", "attributes": attributes}
+        with self._lock:
+            self.spans.append(span)
+        return span
+
+    def to_json(self) -> Dict[str, Any]:
+        with self._lock:
+            spans = [dict(s) for s in self.spans]
+        for s in spans:
+            s["duration"] = (s["end"] - s["start"]) if s["end"] else None
+        return {"build_id": self.build_id, "spans": spans}
+
+    def to_chrome_trace(self) -> Dict[str, Any]:
+        """Trace Event Format (chrome://tracing, Perfetto); matrix cells get their own rows."""
+        with self._lock:
+            spans = list(self.spans)
+        by_id = {s["span_id"]: s for s in spans}
+
+        def lane(s):
+            while s is not None:
+                if "lane" in s["attributes"]:
+                    return s["attributes"]["lane"]
+                s = by_id.get(s["parent_id"])
+            return 0
+
+        now = time.time()
+        return {"traceEvents": [{"name": s["name"], "cat": "ci", "ph": "X", "pid": 1, "tid": lane(s),
+                                 "ts": int(s["start"] * 1e6), "dur": int(((s["end"] or now) - s["start"]) * 1e6),
+                                 "args": {**s["attributes"], "status": s["status"]}} for s in spans],
+                "displayTimeUnit": "ms"}
+
+def start_trace(build_id: str) -> BuildTrace:
+    trace = BuildTrace(build_id)
+    with _lock:
+        _traces[build_id] = trace
+        while len(_traces) > MAX_TRACES:
+            _traces.popitem(last=False)
+    return trace
+
+def get_trace(build_id: str) -> Optional[BuildTrace]:
+    return _traces.get(build_id)
+
+@contextmanager
+def use_trace(trace: BuildTrace):
+    """Make trace the target of span() calls in this context (and tasks created from it)."""
+    token = _current_trace.set(trace)
+    try:
+        yield trace
+    finally:
+        _current_trace.reset(token)
+
+def record_span(name: str, start: float, end: float, **attributes):
+    """Add an already-finished span (e.g. queue wait) under the current span."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.record(name, start, end, _current_span.get(), **attributes)
+
+@contextmanager
+def span(name: str, **attributes):
+    trace = _current_trace.get()
+    if trace is None:
+        yield None
+        return
+    s = trace.record(name, time.time(), None, _current_span.get(), **attributes)
+    token = _current_span.set(s["span_id"])
+    try:
+        yield s
+    except BaseException:
+        s["status"] = "ERROR"
+        raise
+    finally:
+        _current_span.reset(token)
+        s["end"] = time.time()
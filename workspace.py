@@ -0,0 +1,183 @@
+# backend/app/workspace.py
+# Pool of git workspaces per repository under REPO_BASE_PATH/<repo>/ws-<id>. A build borrows an idle
+# workspace, which is reset with fetch + `reset --hard` + `clean -fdx` (far cheaper than a fresh clone)
+# and returned afterwards. Unwanted workspaces are renamed into REPO_BASE_PATH/.trash, which is instant,
+# and deleted by a background thread. Above the disk watermark, least recently used idle workspaces go first.
+# Matrix cells get their own worktree of the build's workspace under <repo>/.cells for the cell's lifetime.
+import hashlib
+import os
+import queue as _queue_mod
+import re
+import shutil
+import threading
+import time
+import uuid
+from typing import Dict, List, Optional
+from .config import settings
+from .metrics import GIT_DURATION
+from .pipeline.multibranch import clone_or_update_repo
+from .tracing import span
+
+class Workspace:
+    def __init__(self, path: str, repo_url: str):
+        self.path = path
+        self.repo_url = repo_url
+        self.last_used = time.time()
+
+_idle: Dict[str, List[Workspace]] = {}  # repo key -> idle workspaces, most recently used last
+_busy: Dict[str, Workspace] = {}  # path -> workspace
+_lock = threading.Lock()
+_trash: "_queue_mod.Queue[str]" = _queue_mod.Queue()
+_trash_thread = None
+
+def _repo_key(repo_url: str) -> str:
+    name = re.sub(r"[^A-Za-z0-9_.-]", "_", repo_url.rstrip("/").rsplit("/", 1)[-1])[:40]
+    return f"{name}-{hashlib.sha1(repo_url.encode()).hexdigest()[:10]}"
+
+def _trash_dir() -> str:
+    return os.path.join(settings.REPO_BASE_PATH, ".trash")
+
+def _reset(ws: Workspace, ref: Optional[str]):
+    from git import Repo, GitCommandError
+    repo = Repo(ws.path)
+    with GIT_DURATION.labels("fetch").time(), span("git_fetch"):
+        repo.remotes.origin.fetch(prune=True)
+    target = f"origin/{ref}" if ref else "origin/HEAD"
+    try:
+        repo.git.reset("--hard", target)
+    except GitCommandError:
+        repo.git.reset("--hard", "FETCH_HEAD")
+    # -x also drops ignored files (target/, node_modules/) so nothing leaks from the previous build
+    repo.git.clean("-fdx")
+
+def acquire_workspace(repo_url: str, ref: Optional[str] = None) -> str:
+    key = _repo_key(repo_url)
+    with _lock:
+        idle = _idle.get(key)
+        ws = idle.pop() if idle else None
+    if ws is None:
+        ws = Workspace(os.path.join(settings.REPO_BASE_PATH, key, f"ws-{uuid.uuid4().hex[:8]}"), repo_url)
+        os.makedirs(os.path.dirname(ws.path), exist_ok=True)
+        clone_or_update_repo(repo_url, ws.path)
+        if ref:
+            _reset(ws, ref)
+    else:
+        try:
+            with span("workspace_reset"):
+                _reset(ws, ref)
+        except Exception:
+            # a broken checkout is not worth repairing; start over with a fresh clone
+            discard(ws.path)
+            return acquire_workspace(repo_url, ref)
+    with _lock:
+        _busy[ws.path] = ws
+    return ws.path
+
+def release_workspace(path: str):
+    with _lock:
+        ws = _busy.pop(path, None)
+        if ws is None:
+            return
+        ws.last_used = time.time()
+        idle = _idle.setdefault(_repo_key(ws.repo_url), [])
+        idle.append(ws)
+        surplus = idle[:-settings.WORKSPACE_POOL_SIZE] if len(idle) > settings.WORKSPACE_POOL_SIZE else []
+        del idle[:len(surplus)]
+    for extra in surplus:
+        _move_to_trash(extra.path)
+    _check_watermark()
+
+def add_cell_checkout(path: str) -> str:
+    """
+    A private checkout of the workspace's HEAD for one matrix cell, so parallel cells don't share target/,
+    reports or artifacts: a detached `git worktree` (no clone, objects are shared), or a copy for non-git dirs.
+    """
+    cell = os.path.join(os.path.dirname(path), ".cells", f"{os.path.basename(path)}-{uuid.uuid4().hex[:8]}")
+    os.makedirs(os.path.dirname(cell), exist_ok=True)
+    from git import Repo, GitCommandError, InvalidGitRepositoryError
+    try:
+        Repo(path).git.worktree("add", "--detach", cell, "HEAD")
+    except (GitCommandError, InvalidGitRepositoryError):
+        shutil.rmtree(cell, ignore_errors=True)
+        shutil.copytree(path, cell, symlinks=True)
+    return cell
+
+def remove_cell_checkout(path: str, cell: str):
+    _move_to_trash(cell)
+    from git import Repo, GitCommandError, InvalidGitRepositoryError
+    try:
+        Repo(path).git.worktree("prune")  # the directory is gone, so this drops its worktree metadata
+    except (GitCommandError, InvalidGitRepositoryError):
+        pass
+
+def prewarm(repo_url: str, count: Optional[int] = None):
+    """Clone workspaces in the background so the first builds of a repo skip the clone."""
+    def run():
+        key = _repo_key(repo_url)
+        with _lock:
+            missing = (count or settings.WORKSPACE_POOL_SIZE) - len(_idle.get(key, []))
+        for _ in range(missing):
+            try:
+                release_workspace(acquire_workspace(repo_url))
+            except Exception as e:
+                print("Workspace prewarm failed:", e)
+                return
+    threading.Thread(target=run, daemon=True).start()
+
+def discard(path: str):
+    with _lock:
+        _busy.pop(path, None)
+        for idle in _idle.values():
+            idle[:] = [w for w in idle if w.path != path]
+    _move_to_trash(path)
+
+def _move_to_trash(path: str):
+    _ensure_trash_thread()
+    target = os.path.join(_trash_dir(), uuid.uuid4().hex)
+    os.makedirs(_trash_dir(), exist_ok=True)
+    try:
+        os.rename(path, target)  # same filesystem: O(1), the build never waits for the recursive delete
+    except FileNotFoundError:
+        return
+    _trash.put(target)
+
+def _trash_loop():
+    for leftover in os.listdir(_trash_dir()):
+        _trash.put(os.path.join(_trash_dir(), leftover))
+    while True:
+        path = _trash.get()
+        shutil.rmtree(path, ignore_errors=True)
+        if _trash.empty():
+            _check_watermark()
+
+def _ensure_trash_thread():
+    global _trash_thread
+    with _lock:
+        if _trash_thread is None or not _trash_thread.is_alive():
+            os.makedirs(_trash_dir(), exist_ok=True)
+            _trash_thread = threading.Thread(target=_trash_loop, daemon=True)
+            _trash_thread.start()
+
+def _disk_used_fraction() -> float:
+    usage = shutil.disk_usage(settings.REPO_BASE_PATH)
+    return usage.used / usage.total if usage.total else 0.0
+
+def _check_watermark():
+    """
+    Evict the least recently used idle workspace while the disk is above the watermark. Deletion is
+    asynchronous, so one eviction is issued at a time; the trash thread checks again once it has freed it.
+    """
+    if not _trash.empty() or _disk_used_fraction() < settings.WORKSPACE_DISK_HIGH_WATERMARK:
+        return
+    with _lock:
+        candidates = [w for idle in _idle.values() for w in idle]
+        if not candidates:
+            return
+        victim = min(candidates, key=lambda w: w.last_used)
+        _idle[_repo_key(victim.repo_url)].remove(victim)
+    _move_to_trash(victim.path)
+
+def workspace_status() -> Dict:
+    with _lock:
+        return {"busy": len(_busy), "idle": {k: len(v) for k, v in _idle.items() if v},
+                "trash_pending": _trash.qsize(), "disk_used": round(_disk_used_fraction(), 3)}